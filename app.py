@@ -1,11 +1,23 @@
 import streamlit as st
-import streamlit.components.v1 as components
 import pandas as pd
+import numpy as np
 from datetime import datetime, timedelta, timezone
 import os
 import openpyxl
 import base64
 import time
+import json
+import hashlib
+import threading
+import bisect
+import heapq
+import unicodedata
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import queue
+import uuid
+import sqlite3
+import sys
+from contextlib import closing, contextmanager
 from supabase import create_client, Client
 import smtplib
 from email.mime.text import MIMEText
@@ -15,6 +27,142 @@ from email.mime.multipart import MIMEMultipart
 # 1. CONFIGURAÇÕES DA PÁGINA
 # ==========================================
 st.set_page_config(page_title="Movimentações - Headcount", layout="wide", initial_sidebar_state="collapsed")
+inicio_rerun = time.perf_counter()
+
+# ==========================================
+# 1.1 MÉTRICAS DE DESEMPENHO (HISTOGRAMAS POR ETAPA)
+# ==========================================
+LIMITES_HISTOGRAMA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+USUARIO_SEGUNDO_PLANO = "(segundo plano)"
+
+@st.cache_resource
+def metricas_desempenho():
+    # Uma série (contagem por faixa, soma, total) por (etapa, usuário), compartilhada por todo o servidor
+    return {'lock': threading.Lock(), 'series': {}}
+
+def registrar_tempo(etapa, usuario, segundos, metricas=None):
+    metricas = metricas or metricas_desempenho()
+    with metricas['lock']:
+        serie = metricas['series'].setdefault((etapa, usuario), {'faixas': [0] * (len(LIMITES_HISTOGRAMA) + 1), 'soma': 0.0, 'total': 0})
+        serie['faixas'][bisect.bisect_left(LIMITES_HISTOGRAMA, segundos)] += 1
+        serie['soma'] += segundos
+        serie['total'] += 1
+
+@contextmanager
+def medir(etapa, usuario=None, metricas=None):
+    """Cronometra o bloco e registra no histograma da etapa.
+
+    Threads de segundo plano devem informar usuario e metricas, pois não têm acesso à sessão nem ao cache.
+    """
+    if usuario is None:
+        usuario = st.session_state.get('usuario_logado') or "(anônimo)"
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        registrar_tempo(etapa, usuario, time.perf_counter() - inicio, metricas)
+
+def quantil_histograma(faixas, q):
+    """Estimativa do quantil q por interpolação linear dentro da faixa (mesmo critério do Prometheus)."""
+    alvo = q * sum(faixas)
+    acumulado = 0
+    for i, quantidade in enumerate(faixas):
+        if quantidade and acumulado + quantidade >= alvo:
+            inferior = LIMITES_HISTOGRAMA[i - 1] if i else 0.0
+            if i == len(LIMITES_HISTOGRAMA):
+                return inferior
+            return inferior + (LIMITES_HISTOGRAMA[i] - inferior) * (alvo - acumulado) / quantidade
+        acumulado += quantidade
+    return 0.0
+
+def resumo_metricas(metricas=None, por_usuario=True):
+    """DataFrame com contagem, média, p50 e p99 por etapa (e por usuário, se pedido)."""
+    metricas = metricas or metricas_desempenho()
+    with metricas['lock']:
+        series = {chave: (list(s['faixas']), s['soma'], s['total']) for chave, s in metricas['series'].items()}
+    if not por_usuario:
+        agregadas = {}
+        for (etapa, _), (faixas, soma, total) in series.items():
+            atual = agregadas.setdefault((etapa, "(todos)"), ([0] * len(faixas), 0.0, 0))
+            agregadas[(etapa, "(todos)")] = ([a + b for a, b in zip(atual[0], faixas)], atual[1] + soma, atual[2] + total)
+        series = agregadas
+    linhas = []
+    for (etapa, usuario), (faixas, soma, total) in sorted(series.items()):
+        linhas.append({
+            "Etapa": etapa, "Usuário": usuario, "Execuções": total, "Média (s)": soma / total,
+            "p50 (s)": quantil_histograma(faixas, 0.5), "p99 (s)": quantil_histograma(faixas, 0.99),
+        })
+    return pd.DataFrame(linhas, columns=["Etapa", "Usuário", "Execuções", "Média (s)", "p50 (s)", "p99 (s)"])
+
+def texto_prometheus(metricas=None):
+    """Histogramas no formato de exposição de texto do Prometheus."""
+    metricas = metricas or metricas_desempenho()
+    with metricas['lock']:
+        series = {chave: (list(s['faixas']), s['soma'], s['total']) for chave, s in metricas['series'].items()}
+
+    def rotulo(valor):
+        return valor.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    linhas = [
+        "# HELP headcount_etapa_segundos Duração das etapas do app de movimentações, em segundos.",
+        "# TYPE headcount_etapa_segundos histogram",
+    ]
+    for (etapa, usuario), (faixas, soma, total) in sorted(series.items()):
+        base = f'etapa="{rotulo(etapa)}",usuario="{rotulo(usuario)}"'
+        acumulado = 0
+        for limite, quantidade in zip(LIMITES_HISTOGRAMA + ("+Inf",), faixas):
+            acumulado += quantidade
+            linhas.append(f'headcount_etapa_segundos_bucket{{{base},le="{limite}"}} {acumulado}')
+        linhas.append(f"headcount_etapa_segundos_sum{{{base}}} {soma}")
+        linhas.append(f"headcount_etapa_segundos_count{{{base}}} {total}")
+    return "\n".join(linhas) + "\n"
+
+# Serviços que precisam existir uma única vez por processo, mesmo depois de um
+# st.cache_resource.clear(): ficam no módulo sys, que sobrevive aos reruns do script.
+SERVICOS_PROCESSO = sys.__dict__.setdefault("servicos_headcount", {'lock': threading.Lock()})
+
+def iniciar_servidor_metricas(porta):
+    """Expõe /metrics em uma porta própria para o Prometheus coletar (o Streamlit não permite rotas extras).
+
+    Devolve a mensagem de erro se a porta não puder ser aberta (por exemplo, já ocupada
+    por outro processo do servidor) em vez de derrubar o app.
+    """
+    with SERVICOS_PROCESSO['lock']:
+        servico = SERVICOS_PROCESSO.setdefault('servidor_metricas', {'porta': None, 'erro': None})
+        servico['metricas'] = metricas_desempenho()  # depois de limpar o cache, passa a servir os histogramas novos
+        if servico['porta'] == porta:
+            return servico['erro']
+
+        class RotaMetricas(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                corpo = texto_prometheus(servico['metricas']).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(corpo)))
+                self.end_headers()
+                self.wfile.write(corpo)
+
+            def log_message(self, *args):
+                pass
+
+        if servico.get('servidor') is not None:
+            servico['servidor'].shutdown()
+            servico['servidor'].server_close()
+            servico['servidor'] = None
+        servico['porta'] = porta
+        try:
+            servico['servidor'] = ThreadingHTTPServer(("0.0.0.0", porta), RotaMetricas)
+        except OSError as e:
+            servico['erro'] = f"Não foi possível abrir a porta {porta} para o /metrics: {e}"
+            return servico['erro']
+        servico['erro'] = None
+        threading.Thread(target=servico['servidor'].serve_forever, name="servidor-metricas", daemon=True).start()
+        return None
+
+erro_servidor_metricas = iniciar_servidor_metricas(int(st.secrets["PORTA_METRICAS"])) if st.secrets.get("PORTA_METRICAS") else None
 
 # ==========================================
 # 2. CONEXÃO COM O SUPABASE E FUSO
@@ -30,46 +178,247 @@ def init_connection() -> Client:
 supabase = init_connection()
 
 # ==========================================
-# 3. O MOTOR JAVASCRIPT (Versão Segura - Anti-travamento)
+# 2.1 FILA LOCAL DE GRAVAÇÕES (WRITE-BEHIND)
 # ==========================================
-js_code = """
-<script>
-const parentDoc = window.parent.document;
+# Os inserts vão primeiro para um diário SQLite local (modo WAL) e uma thread os
+# envia em lotes ao Supabase. A coluna chave_idempotencia (única nas duas tabelas)
+# garante que um lote reenviado após falha não duplica registros.
+ARQUIVO_FILA_GRAVACOES = 'fila_gravacoes.db'
+LOTE_GRAVACOES = 500
+INTERVALO_GRAVACOES = 5  # segundos entre tentativas quando não há aviso de novos registros
+ESPERA_MAXIMA_GRAVACOES = 300  # teto do backoff entre falhas consecutivas
+RETENCAO_GRAVACOES = timedelta(days=7)  # registros confirmados ficam no diário por esse período
+TENTATIVAS_LOTE_GRAVACOES = 3  # falhas em lote antes de o registro passar a ser enviado sozinho
+TENTATIVAS_REGISTRO_GRAVACAO = 5  # recusas do Supabase a um registro antes de marcá-lo como 'falhou'
+CLASSES_RECUSA_SQLSTATE = ("22", "23", "42")  # dado inválido, restrição violada, coluna/tabela ou permissão
 
-function aplicarEstilos() {
-    const header = parentDoc.querySelector('header');
-    if(header) header.style.display = 'none';
+def conexao_fila_gravacoes():
+    conn = sqlite3.connect(ARQUIVO_FILA_GRAVACOES, timeout=30)
+    conn.row_factory = sqlite3.Row
+    return conn
 
-    const mainBlock = parentDoc.querySelector('.block-container');
-    if(mainBlock) {
-        mainBlock.style.paddingTop = '1.5rem';
-        mainBlock.style.paddingBottom = '1rem';
-        mainBlock.style.maxWidth = '98%';
-    }
+def enfileirar_gravacoes(tabela, lista_dados, usuario):
+    """Grava os registros no diário local e devolve o id do envio para acompanhar a confirmação."""
+    id_envio = uuid.uuid4().hex
+    agora = datetime.now(fuso_br).isoformat()
+    linhas = []
+    for dados in lista_dados:
+        chave = uuid.uuid4().hex
+        linhas.append((chave, id_envio, tabela, json.dumps({**dados, "chave_idempotencia": chave}), usuario, agora))
+    with medir("fila_local_gravacao"), closing(conexao_fila_gravacoes()) as conn, conn:
+        conn.executemany(
+            "INSERT INTO gravacoes (chave, envio, tabela, dados, usuario, criado_em) VALUES (?, ?, ?, ?, ?, ?)", linhas
+        )
+    fila_gravacoes()['aviso'].set()
+    return id_envio
+
+def status_envios(ids_envio):
+    """{id_envio: (pendentes, recusados, erro)} dos envios informados."""
+    if not ids_envio:
+        return {}
+    marcadores = ",".join("?" * len(ids_envio))
+    with closing(conexao_fila_gravacoes()) as conn:
+        linhas = conn.execute(
+            f"""SELECT envio, SUM(estado = 'pendente') AS pendentes, SUM(estado = 'falhou') AS falhas, MAX(erro) AS erro
+                FROM gravacoes WHERE envio IN ({marcadores}) GROUP BY envio""",
+            list(ids_envio),
+        ).fetchall()
+    return {linha['envio']: (linha['pendentes'], linha['falhas'], linha['erro']) for linha in linhas}
+
+def pendentes_usuario(usuario, tabela):
+    with closing(conexao_fila_gravacoes()) as conn:
+        return conn.execute(
+            "SELECT COUNT(*) FROM gravacoes WHERE usuario = ? AND tabela = ? AND estado = 'pendente'", (usuario, tabela)
+        ).fetchone()[0]
 
-    const blocos = parentDoc.querySelectorAll('div[data-testid="stVerticalBlock"]');
-    blocos.forEach(b => b.style.gap = '0.1rem');
-
-    const botoes = parentDoc.querySelectorAll('button');
-    botoes.forEach(btn => {
-        const txt = btn.innerText.trim();
-        if(txt === '✅ CONFIRMAR MOVIMENTAÇÃO') {
-            btn.style.backgroundColor = '#2e7d32'; btn.style.color = 'white'; btn.style.border = 'none'; btn.style.fontWeight = 'bold';
-        } else if(txt === '📄 Ver Histórico (Consultas)' || txt === 'Nova Movimentação' || txt === 'ACESSAR SISTEMA' || txt === 'ENVIAR SOLICITAÇÃO') {
-            btn.style.backgroundColor = '#1976d2'; btn.style.color = 'white'; btn.style.border = 'none'; btn.style.fontWeight = 'bold';
-        } else if(txt === 'Sair') {
-            btn.style.backgroundColor = '#d32f2f'; btn.style.color = 'white'; btn.style.border = 'none'; btn.style.fontWeight = 'bold';
-        } else if(txt.includes('Não encontrou o posto?')) {
-            btn.style.backgroundColor = '#ff9800'; btn.style.color = 'white'; btn.style.border = 'none'; btn.style.fontWeight = 'bold';
-        }
-    });
+def recusa_do_supabase(erro):
+    """Erro causado pelo próprio registro (dado inválido, restrição, coluna ausente).
+
+    O supabase-py levanta APIError para qualquer resposta fora de 2xx; banco fora do ar,
+    recarga do cache de esquema, JWT vencido e limite de requisições não são recusa do
+    registro e só esperam o backoff.
+    """
+    try:
+        from postgrest.exceptions import APIError
+    except ImportError:
+        return False
+    if not isinstance(erro, APIError):
+        return False
+    codigo = str(erro.code or "")
+    if codigo.startswith("PGRST"):
+        return codigo[5:6] in ("1", "2")  # PGRST1xx/2xx: corpo ou coluna inválidos; 0xx é conexão e 3xx é JWT
+    if codigo.isdigit() and len(codigo) == 3:  # resposta sem JSON: o código é o status HTTP
+        return 400 <= int(codigo) < 500 and int(codigo) not in (401, 403, 408, 429)
+    return codigo[:2] in CLASSES_RECUSA_SQLSTATE
+
+def enviar_gravacoes(tabela, linhas, metricas):
+    with medir("supabase_gravacao", USUARIO_SEGUNDO_PLANO, metricas):
+        supabase.table(tabela).upsert(
+            [json.loads(linha['dados']) for linha in linhas], on_conflict="chave_idempotencia", ignore_duplicates=True
+        ).execute()
+
+def descarregar_gravacoes(metricas=None):
+    """Envia ao Supabase um lote de pendentes por tabela. Devolve True se ainda restarem pendentes.
+
+    Registros que já falharam TENTATIVAS_LOTE_GRAVACOES vezes em lote vão um a um, para que um
+    registro recusado não segure a fila inteira; recusado TENTATIVAS_REGISTRO_GRAVACAO vezes
+    sozinho, ele sai da fila com estado 'falhou' e aparece na tela de métricas.
+    """
+    restam = False
+    with closing(conexao_fila_gravacoes()) as conn:
+        tabelas = [linha[0] for linha in conn.execute("SELECT DISTINCT tabela FROM gravacoes WHERE estado = 'pendente'")]
+        for tabela in tabelas:
+            linhas = conn.execute(
+                "SELECT id, dados, tentativas FROM gravacoes WHERE estado = 'pendente' AND tabela = ? ORDER BY id LIMIT ?",
+                (tabela, LOTE_GRAVACOES),
+            ).fetchall()
+            suspeitas = [linha for linha in linhas if linha['tentativas'] >= TENTATIVAS_LOTE_GRAVACOES]
+            lote = [linha for linha in linhas if linha['tentativas'] < TENTATIVAS_LOTE_GRAVACOES]
+
+            for linha in suspeitas:
+                try:
+                    enviar_gravacoes(tabela, [linha], metricas)
+                except Exception as e:
+                    if not recusa_do_supabase(e):
+                        raise  # sem conexão: espera o backoff em vez de tentar os outros um a um
+                    estado = 'falhou' if linha['tentativas'] + 1 >= TENTATIVAS_REGISTRO_GRAVACAO else 'pendente'
+                    with conn:
+                        conn.execute(
+                            "UPDATE gravacoes SET tentativas = tentativas + 1, erro = ?, estado = ? WHERE id = ?", (str(e), estado, linha['id'])
+                        )
+                    continue
+                with conn:
+                    conn.execute("UPDATE gravacoes SET estado = 'confirmado', erro = NULL WHERE id = ?", (linha['id'],))
+
+            if lote:
+                ids = [linha['id'] for linha in lote]
+                marcadores = ",".join("?" * len(ids))
+                try:
+                    enviar_gravacoes(tabela, lote, metricas)
+                except Exception as e:
+                    # Só recusas contam tentativa: uma queda do banco não pode mandar o lote para o envio um a um
+                    incremento = 1 if recusa_do_supabase(e) else 0
+                    with conn:
+                        conn.execute(
+                            f"UPDATE gravacoes SET tentativas = tentativas + ?, erro = ? WHERE id IN ({marcadores})", [incremento, str(e)] + ids
+                        )
+                    raise
+                with conn:
+                    conn.execute(f"UPDATE gravacoes SET estado = 'confirmado', erro = NULL WHERE id IN ({marcadores})", ids)
+            restam = restam or len(linhas) == LOTE_GRAVACOES
+        with conn:
+            limite = (datetime.now(fuso_br) - RETENCAO_GRAVACOES).isoformat()
+            conn.execute("DELETE FROM gravacoes WHERE estado = 'confirmado' AND criado_em < ?", (limite,))
+    return restam
+
+def gravacoes_recusadas():
+    """Registros que o Supabase recusou de vez, para o administrador corrigir e reenviar."""
+    with closing(conexao_fila_gravacoes()) as conn:
+        return pd.read_sql_query(
+            "SELECT id, tabela, usuario, criado_em, tentativas, erro, dados FROM gravacoes WHERE estado = 'falhou' ORDER BY id", conn
+        )
+
+def reenviar_gravacoes_recusadas():
+    with closing(conexao_fila_gravacoes()) as conn, conn:
+        conn.execute("UPDATE gravacoes SET estado = 'pendente', tentativas = 0 WHERE estado = 'falhou'")
+    fila_gravacoes()['aviso'].set()
+
+def processar_fila_gravacoes(fila):
+    falhas = 0
+    while True:
+        espera = INTERVALO_GRAVACOES if not falhas else min(ESPERA_MAXIMA_GRAVACOES, INTERVALO_GRAVACOES * 2 ** falhas)
+        fila['aviso'].wait(espera)
+        fila['aviso'].clear()
+        try:
+            while descarregar_gravacoes(fila['metricas']):
+                pass
+            falhas = 0
+        except Exception:
+            falhas += 1
+
+@st.cache_resource
+def preparar_diario_gravacoes():
+    """Cria o diário em modo WAL e suas tabelas, se ainda não existirem."""
+    with closing(conexao_fila_gravacoes()) as conn, conn:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS gravacoes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                chave TEXT UNIQUE NOT NULL,
+                envio TEXT NOT NULL,
+                tabela TEXT NOT NULL,
+                dados TEXT NOT NULL,
+                usuario TEXT,
+                criado_em TEXT NOT NULL,
+                estado TEXT NOT NULL DEFAULT 'pendente',
+                tentativas INTEGER NOT NULL DEFAULT 0,
+                erro TEXT
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_gravacoes_estado ON gravacoes (estado, tabela, id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_gravacoes_envio ON gravacoes (envio)")
+
+def fila_gravacoes():
+    """Thread única por processo que descarrega o diário, como o servidor de métricas: depois de um
+    st.cache_resource.clear() não sobe um segundo descarregador sobre as mesmas linhas do SQLite."""
+    preparar_diario_gravacoes()
+    with SERVICOS_PROCESSO['lock']:
+        fila = SERVICOS_PROCESSO.get('fila_gravacoes')
+        if fila is None:
+            fila = SERVICOS_PROCESSO['fila_gravacoes'] = {'aviso': threading.Event(), 'metricas': metricas_desempenho()}
+            threading.Thread(target=processar_fila_gravacoes, args=(fila,), name="fila-gravacoes", daemon=True).start()
+            fila['aviso'].set()  # envia o que ficou pendente de uma execução anterior
+        fila['metricas'] = metricas_desempenho()
+    return fila
+
+fila_gravacoes()
+
+# ==========================================
+# 3. ESTILOS E RECURSOS ESTÁTICOS
+# ==========================================
+# CSS puro aplicado pelo navegador a cada renderização (sem JavaScript de verificação).
+# Os botões coloridos são identificados pela classe st-key-<key> que o Streamlit
+# coloca no contêiner de cada widget com key (key no form_submit_button exige o Streamlit 1.49).
+CSS_APP = """
+<style>
+header[data-testid="stHeader"] { display: none; }
+.block-container, [data-testid="stMainBlockContainer"] {
+    padding-top: 1.5rem; padding-bottom: 1rem; max-width: 98%;
+}
+div[data-testid="stVerticalBlock"] { gap: 0.1rem !important; }
+
+.st-key-btn_confirmar button, .st-key-btn_confirmar_lote button,
+.st-key-btn_historico button, .st-key-btn_nova button, .st-key-btn_lote button, .st-key-btn_acessar button, .st-key-btn_enviar_solicitacao button,
+.st-key-btn_sair button, .st-key-btn_solicitar_posto button {
+    color: white; border: none; font-weight: bold;
 }
+.st-key-btn_confirmar button, .st-key-btn_confirmar_lote button { background-color: #2e7d32; }
+.st-key-btn_historico button, .st-key-btn_nova button, .st-key-btn_lote button, .st-key-btn_acessar button, .st-key-btn_enviar_solicitacao button { background-color: #1976d2; }
+.st-key-btn_sair button { background-color: #d32f2f; }
+.st-key-btn_solicitar_posto button { background-color: #ff9800; }
+</style>
+"""
+st.markdown(CSS_APP, unsafe_allow_html=True)
 
-// Verifica e aplica as cores a cada 500ms
-setInterval(aplicarEstilos, 500);
-</script>
+HTML_CABECALHO_SAIDA = """
+<div style="background-color: #fff5f5; border: 2px solid #ffcdd2; border-radius: 8px; padding: 12px; margin-bottom: 15px;">
+    <h4 style="text-align: center; color: #b71c1c; margin: 0;">VAGA DE SAÍDA (RETIRADA)</h4>
+</div>
+"""
+HTML_CABECALHO_ENTRADA = """
+<div style="background-color: #f1f8e9; border: 2px solid #c8e6c9; border-radius: 8px; padding: 12px; margin-bottom: 15px;">
+    <h4 style="text-align: center; color: #1b5e20; margin: 0;">VAGA DE ENTRADA (NOVA)</h4>
+</div>
 """
-components.html(js_code, height=0, width=0)
+
+@st.cache_resource
+def html_logo(tamanho):
+    # Lê e codifica o logo uma única vez por tamanho, em vez de a cada rerun
+    if not os.path.exists("logo.png"):
+        return None
+    with open("logo.png", "rb") as f:
+        encoded = base64.b64encode(f.read()).decode()
+    return f'<div style="text-align: center; margin-bottom: 10px;"><img src="data:image/png;base64,{encoded}" width="{tamanho}"></div>'
 
 # ==========================================
 # 4. PUXANDO USUÁRIOS DO COFRE DE SEGREDOS
@@ -80,28 +429,379 @@ except KeyError:
     st.error("Erro Crítico: A seção [usuarios] não foi encontrada nos Secrets do Streamlit.")
     USUARIOS_PERMITIDOS = {}
 
+# Usuários que podem ver a tela de métricas (lista opcional nos Secrets)
+ADMINISTRADORES = set(st.secrets.get("administradores", []))
+
 # ==========================================
 # 5. LER EXCEL (PARÂMETROS LOCAIS)
 # ==========================================
-@st.cache_data
-def carregar_dados_excel():
-    arquivo_excel = 'parametros.xlsx'
-    if not os.path.exists(arquivo_excel):
-        return pd.DataFrame(columns=['unidade', 'cc', 'sub', 'gestor', 'posto', 'cargo', 'requisitante'])
+ARQUIVO_EXCEL = 'parametros.xlsx'
+ARQUIVO_SNAPSHOT_META = 'parametros.snapshot.json'
+PREFIXO_SNAPSHOT_CODIGOS = 'parametros.snapshot.'
+COLUNAS_PARAMETROS = ['unidade', 'cc', 'sub', 'gestor', 'posto', 'cargo', 'requisitante']
+INTERVALO_RECARGA_PARAMETROS = 30  # segundos entre verificações do parametros.xlsx
+
+def assinatura_excel():
+    """(mtime, tamanho) do parametros.xlsx, ou None se o arquivo não existir."""
+    try:
+        info = os.stat(ARQUIVO_EXCEL)
+    except FileNotFoundError:
+        return None
+    return [info.st_mtime_ns, info.st_size]
+
+def hash_arquivo(caminho):
+    sha = hashlib.sha256()
+    with open(caminho, "rb") as f:
+        for bloco in iter(lambda: f.read(1 << 20), b""):
+            sha.update(bloco)
+    return sha.hexdigest()
+
+def ler_planilha_parametros():
+    df = pd.read_excel(ARQUIVO_EXCEL, dtype=str).iloc[:, :7]
+    df.columns = COLUNAS_PARAMETROS
+    return df.fillna("")
+
+def codificar_parametros(df):
+    """Catálogo como matriz int32 (uma coluna por campo, -1 = vazio) e um dicionário ordenado por coluna.
+
+    Os dicionários ficam em ordem alfabética, então ordenar por código é o mesmo que ordenar pelo texto.
+    """
+    codigos = np.empty((len(df), len(COLUNAS_PARAMETROS)), dtype=np.int32)
+    dicionarios = {}
+    for i, coluna in enumerate(COLUNAS_PARAMETROS):
+        cod, valores = pd.factorize(df[coluna], sort=True)
+        valores = list(valores)
+        if valores and valores[0] == "":
+            cod, valores = cod - 1, valores[1:]
+        codigos[:, i] = cod
+        dicionarios[coluna] = valores
+    return {'codigos': codigos, 'dicionarios': dicionarios}
+
+def catalogo_vazio():
+    return {'codigos': np.empty((0, len(COLUNAS_PARAMETROS)), dtype=np.int32), 'dicionarios': {c: [] for c in COLUNAS_PARAMETROS}}
+
+def gravar_substituindo(caminho, modo, escrever):
+    """Grava em um temporário exclusivo deste processo e troca pelo arquivo final de uma vez.
+
+    Com vários processos do servidor percebendo a mesma planilha nova, cada um escreve no seu
+    temporário: ninguém trunca um arquivo que outro está renomeando ou abrindo com mmap.
+    """
+    temporario = f"{caminho}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
     try:
-        df = pd.read_excel(arquivo_excel, dtype=str).iloc[:, :7]
-        df.columns = ['unidade', 'cc', 'sub', 'gestor', 'posto', 'cargo', 'requisitante']
-        return df.fillna("") 
+        with open(temporario, modo, **({} if "b" in modo else {'encoding': "utf-8"})) as f:
+            escrever(f)
+        os.replace(temporario, caminho)
+    except OSError:
+        try:
+            os.remove(temporario)
+        except OSError:
+            pass
+        raise
+
+def carregar_snapshot_parametros(assinatura):
+    """Abre o snapshot codificado do catálogo, reconstruindo-o a partir do Excel só quando o arquivo mudou.
+
+    Os códigos ficam em um .npy aberto com mmap somente leitura: todos os processos do servidor
+    compartilham as mesmas páginas em memória. O nome do .npy leva o hash da planilha e o JSON de
+    metadados (com os dicionários) é trocado por último, então quem lê nunca mistura versões.
+    """
+    meta = {}
+    if os.path.exists(ARQUIVO_SNAPSHOT_META):
+        with open(ARQUIVO_SNAPSHOT_META, encoding="utf-8") as f:
+            meta = json.load(f)
+    snapshot_existe = bool(meta.get('arquivo_codigos')) and os.path.exists(meta['arquivo_codigos'])
+    if snapshot_existe and meta.get('assinatura') == assinatura:
+        return {'codigos': np.load(meta['arquivo_codigos'], mmap_mode='r'), 'dicionarios': meta['dicionarios']}
+
+    # mtime mudou: o hash decide se o conteúdo mudou de fato
+    sha = hash_arquivo(ARQUIVO_EXCEL)
+    if snapshot_existe and meta.get('sha256') == sha:
+        catalogo = {'codigos': np.load(meta['arquivo_codigos'], mmap_mode='r'), 'dicionarios': meta['dicionarios']}
+    else:
+        catalogo = codificar_parametros(ler_planilha_parametros())
+        arquivo_codigos = f"{PREFIXO_SNAPSHOT_CODIGOS}{sha[:16]}.npy"
+        try:
+            gravar_substituindo(arquivo_codigos, "wb", lambda f: np.save(f, catalogo['codigos']))
+        except OSError:
+            # Disco somente leitura segue com o catálogo em memória; se o arquivo existe, outro
+            # processo gravou o mesmo conteúdo (o nome leva o hash) e ele pode ser usado
+            if not os.path.exists(arquivo_codigos):
+                return catalogo
+        meta = {'arquivo_codigos': arquivo_codigos, 'dicionarios': catalogo['dicionarios']}
+        catalogo['codigos'] = np.load(arquivo_codigos, mmap_mode='r')
+    try:
+        gravar_substituindo(
+            ARQUIVO_SNAPSHOT_META, "w", lambda f: json.dump({**meta, 'assinatura': assinatura, 'sha256': sha}, f, ensure_ascii=False)
+        )
+    except OSError:
+        return catalogo
+    # Versões antigas podem ser apagadas mesmo se outro processo ainda as mapeia (o conteúdo segue válido para ele)
+    for nome in os.listdir("."):
+        if nome.startswith(PREFIXO_SNAPSHOT_CODIGOS) and nome.endswith(".npy") and nome != meta['arquivo_codigos']:
+            try:
+                os.remove(nome)
+            except OSError:
+                pass
+    return catalogo
+
+@st.cache_resource(max_entries=2)
+def carregar_catalogo(assinatura):
+    if assinatura is None:
+        return catalogo_vazio()
+    if assinatura[0] == 'supabase':
+        catalogos = sincronizacao_parametros['catalogos']
+        return catalogos.get(assinatura[1]) or catalogos[max(catalogos)]
+    try:
+        return carregar_snapshot_parametros(assinatura)
     except:
-        return pd.DataFrame(columns=['unidade', 'cc', 'sub', 'gestor', 'posto', 'cargo', 'requisitante'])
+        try:
+            return codificar_parametros(ler_planilha_parametros())
+        except:
+            return catalogo_vazio()
+
+@st.cache_resource
+def iniciar_monitor_parametros():
+    """Verifica o parametros.xlsx em segundo plano e prepara o novo snapshot sem reiniciar o app."""
+    estado = {'assinatura': assinatura_excel()}
+
+    def monitorar():
+        while True:
+            time.sleep(INTERVALO_RECARGA_PARAMETROS)
+            nova = assinatura_excel()
+            if nova == estado['assinatura']:
+                continue
+            try:
+                if nova is not None:
+                    carregar_snapshot_parametros(nova)
+            except Exception:
+                continue  # arquivo ainda sendo gravado; tenta de novo no próximo ciclo
+            estado['assinatura'] = nova
+
+    threading.Thread(target=monitorar, name="monitor-parametros", daemon=True).start()
+    return estado
+
+# --- CATÁLOGO SINCRONIZADO COM O SUPABASE (OPCIONAL) ---
+# Com o segredo TABELA_PARAMETROS, o catálogo vem de uma tabela do Supabase com as
+# colunas de COLUNAS_PARAMETROS, um id, ativo (exclusão lógica) e versao, que recebe
+# o próximo valor de uma sequência a cada insert/update. O app só busca as linhas com
+# versao na faixa recente ou acima da última aplicada e o parametros.xlsx fica como
+# reserva sem conexão.
+TABELA_PARAMETROS = st.secrets.get("TABELA_PARAMETROS")
+INTERVALO_SINCRONIZACAO_PARAMETROS = 30  # segundos entre consultas de linhas alteradas
+LOTE_SINCRONIZACAO_PARAMETROS = 1000
+# A versao sai da sequência antes do commit: uma alteração com versao menor pode ficar visível
+# depois de uma maior já aplicada. Cada sincronização relê essa faixa abaixo da última versão
+# e pula as versões já aplicadas, como o saldo faz com os ids.
+JANELA_SINCRONIZACAO_PARAMETROS = 5000
+
+def buscar_alteracoes_parametros(cliente, tabela, desde_versao):
+    """Linhas com versao acima de desde_versao (inclusive as desativadas), em ordem de versão."""
+    registros = []
+    while True:
+        lote = (
+            cliente.table(tabela).select("id", "versao", "ativo", *COLUNAS_PARAMETROS)
+            .gt("versao", desde_versao).order("versao").limit(LOTE_SINCRONIZACAO_PARAMETROS).execute().data
+        )
+        registros.extend(lote)
+        if len(lote) < LOTE_SINCRONIZACAO_PARAMETROS:
+            return registros
+        desde_versao = lote[-1]['versao']
+
+def aplicar_alteracoes_parametros(sinc, registros):
+    """Corrige as linhas em memória pelo id e publica o catálogo codificado como uma nova publicação.
+
+    A publicação é um contador: uma alteração atrasada não muda a maior versão, mas precisa
+    de uma assinatura nova para o carregar_catalogo não devolver o catálogo antigo.
+    """
+    for registro in registros:
+        if registro.get('ativo') is False:
+            sinc['linhas'].pop(registro['id'], None)
+        else:
+            sinc['linhas'][registro['id']] = tuple(registro.get(coluna) or "" for coluna in COLUNAS_PARAMETROS)
+    sinc['versao'] = max(sinc['versao'] or 0, max(registro['versao'] for registro in registros))
+    sinc['aplicadas'].update(registro['versao'] for registro in registros)
+    piso = sinc['versao'] - JANELA_SINCRONIZACAO_PARAMETROS
+    sinc['aplicadas'] = {v for v in sinc['aplicadas'] if v > piso}
+    catalogo = codificar_parametros(pd.DataFrame(list(sinc['linhas'].values()), columns=COLUNAS_PARAMETROS))
+    # A publicação anterior continua disponível para as sessões que ainda estão no meio de um rerun
+    anteriores = {p: c for p, c in sinc['catalogos'].items() if p == sinc['publicacao']}
+    publicacao = (sinc['publicacao'] or 0) + 1
+    sinc['catalogos'] = {**anteriores, publicacao: catalogo}
+    sinc['publicacao'] = publicacao
+
+def sincronizar_parametros(sinc, cliente):
+    """Busca e aplica as alterações ainda não aplicadas (novas e atrasadas); devolve quantas linhas mudaram."""
+    desde = max(0, (sinc['versao'] or 0) - JANELA_SINCRONIZACAO_PARAMETROS)
+    registros = [r for r in buscar_alteracoes_parametros(cliente, sinc['tabela'], desde) if r['versao'] not in sinc['aplicadas']]
+    if registros:
+        aplicar_alteracoes_parametros(sinc, registros)
+    return len(registros)
+
+@st.cache_resource
+def iniciar_sincronizacao_parametros(tabela, _cliente):
+    """Carga inicial do catálogo pelo Supabase e uma thread que aplica as alterações periodicamente."""
+    sinc = {
+        'tabela': tabela, 'linhas': {}, 'versao': None, 'aplicadas': set(), 'publicacao': None, 'catalogos': {},
+        'erro': None, 'erro_desde': None, 'metricas': metricas_desempenho(),
+    }
+
+    def sincronizar(usuario=None):
+        try:
+            with medir("sincronizacao_parametros", usuario, sinc['metricas']):
+                sincronizar_parametros(sinc, _cliente)
+            sinc['erro'] = sinc['erro_desde'] = None
+        except Exception as e:
+            # Sem conexão: segue com a última versão (ou com o Excel) e o aviso aparece na tela de métricas
+            sinc['erro'] = str(e)
+            sinc['erro_desde'] = sinc['erro_desde'] or datetime.now(fuso_br)
+
+    def monitorar():
+        while True:
+            time.sleep(INTERVALO_SINCRONIZACAO_PARAMETROS)
+            sincronizar(USUARIO_SEGUNDO_PLANO)
+
+    sincronizar()
+    threading.Thread(target=monitorar, name="sincronizacao-parametros", daemon=True).start()
+    return sinc
+
+def assinatura_parametros():
+    """Versão do catálogo em uso: a do Supabase depois da primeira sincronização, senão a do parametros.xlsx."""
+    if sincronizacao_parametros is not None and sincronizacao_parametros['publicacao'] is not None:
+        return ['supabase', sincronizacao_parametros['publicacao']]
+    return monitor_parametros['assinatura']
+
+sincronizacao_parametros = iniciar_sincronizacao_parametros(TABELA_PARAMETROS, supabase) if TABELA_PARAMETROS else None
+monitor_parametros = iniciar_monitor_parametros()
+assinatura_catalogo = assinatura_parametros()
+with medir("carga_parametros"):
+    catalogo_parametros = carregar_catalogo(assinatura_catalogo)
+
+# ==========================================
+# 5.1 ÍNDICE DA CASCATA (UNIDADE → CC → SUB → GESTOR → POSTO → CARGO)
+# ==========================================
+NIVEIS_CASCATA = ['unidade', 'cc', 'sub', 'gestor', 'posto', 'cargo']
+
+def construir_indice_cascata(catalogo):
+    """Pré-calcula as opções ordenadas de cada nível da cascata, indexadas pelo caminho já escolhido."""
+    codigos = np.asarray(catalogo['codigos'])
+    dicionarios = [catalogo['dicionarios'][coluna] for coluna in NIVEIS_CASCATA]
+    caminhos = {}
+    for nivel in range(len(NIVEIS_CASCATA)):
+        bloco = codigos[:, :nivel + 1]
+        # Linhas únicas ordenadas pelo prefixo e depois pelo código do nível (= ordem alfabética)
+        bloco = np.unique(bloco[(bloco >= 0).all(axis=1)], axis=0)
+        opcoes = dicionarios[nivel]
+        if nivel == 0:
+            caminhos[()] = tuple(opcoes[c] for c in bloco[:, 0])
+            continue
+        mudou = np.any(bloco[1:, :nivel] != bloco[:-1, :nivel], axis=1)
+        inicios = np.concatenate(([0], np.flatnonzero(mudou) + 1))
+        fins = np.append(inicios[1:], len(bloco))
+        for inicio, fim in zip(inicios, fins):
+            if inicio == fim:
+                continue
+            chave = tuple(dicionarios[j][c] for j, c in enumerate(bloco[inicio, :nivel]))
+            caminhos[chave] = tuple(opcoes[c] for c in bloco[inicio:fim, nivel])
+    return {
+        'caminhos': caminhos,
+        'cargos': tuple(catalogo['dicionarios']['cargo']),
+        'requisitantes': tuple(catalogo['dicionarios']['requisitante']),
+    }
+
+@st.cache_resource(max_entries=2)
+def obter_indice_cascata(assinatura):
+    # Construído uma única vez por versão do catálogo e compartilhado entre todas as sessões
+    return construir_indice_cascata(carregar_catalogo(assinatura))
+
+with medir("indice_cascata"):
+    indice_cascata = obter_indice_cascata(assinatura_catalogo)
+
+def opcoes_cascata(*caminho):
+    """Opções do próximo nível da cascata; vazio enquanto algum nível anterior não foi escolhido."""
+    if not all(caminho):
+        return ()
+    return indice_cascata['caminhos'].get(caminho, ())
+
+# ==========================================
+# 5.2 PESQUISA NO SERVIDOR (REQUISITANTE, POSTO E CARGO)
+# ==========================================
+# Listas grandes não vão inteiras para o navegador: o usuário digita um trecho e
+# só os melhores resultados viram opções do selectbox.
+COLUNAS_BUSCA = ('requisitante', 'posto', 'cargo')
+COLUNAS_BUSCA_COMPLETA = ('requisitante', 'cargo')  # postos são sempre pesquisados dentro do gestor escolhido
+LIMITE_OPCOES_NAVEGADOR = 300  # até esse tamanho a lista vai inteira, como antes
+RESULTADOS_BUSCA = 50
+
+def normalizar_busca(texto):
+    sem_acento = unicodedata.normalize("NFKD", texto).encode("ascii", "ignore").decode()
+    return " ".join(sem_acento.lower().split())
 
-df_parametros = carregar_dados_excel()
+def trigramas(texto):
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+def construir_indice_busca(catalogo):
+    """Texto normalizado de cada valor e, para as colunas pesquisadas na lista completa, trigramas → posições no dicionário."""
+    indice = {}
+    for coluna in COLUNAS_BUSCA:
+        valores = catalogo['dicionarios'][coluna]
+        normalizados = [normalizar_busca(v) for v in valores]
+        postagens = {}
+        for posicao, texto in enumerate(normalizados if coluna in COLUNAS_BUSCA_COMPLETA else ()):
+            for trigrama in trigramas(texto):
+                postagens.setdefault(trigrama, []).append(posicao)
+        indice[coluna] = {'valores': valores, 'normalizados': dict(zip(valores, normalizados)), 'trigramas': postagens}
+    return indice
+
+@st.cache_resource(max_entries=2)
+def obter_indice_busca(assinatura):
+    return construir_indice_busca(carregar_catalogo(assinatura))
+
+indice_busca = obter_indice_busca(assinatura_catalogo)
+
+def buscar_opcoes(coluna, termo, opcoes, lista_completa=False):
+    """Até RESULTADOS_BUSCA opções que contêm o termo, sem diferenciar acentos e maiúsculas.
+
+    Quem começa com o termo vem primeiro, depois quem tem uma palavra começando com ele.
+    Com lista_completa=True os candidatos saem dos trigramas em vez de percorrer todas as opções.
+    """
+    indice = indice_busca[coluna]
+    termo = normalizar_busca(termo or "")
+    if not termo:
+        return list(opcoes[:RESULTADOS_BUSCA])
+    candidatos = opcoes
+    if lista_completa and len(termo) >= 3:
+        postagens = [indice['trigramas'].get(t, []) for t in trigramas(termo)]
+        candidatos = [indice['valores'][p] for p in min(postagens, key=len)]
+
+    normalizados = indice['normalizados']
+    achados = []
+    for valor in candidatos:
+        texto = normalizados.get(valor) or normalizar_busca(valor)
+        posicao = texto.find(termo)
+        if posicao < 0:
+            continue
+        prioridade = 0 if posicao == 0 else (1 if texto[posicao - 1] == " " else 2)
+        achados.append((prioridade, valor))
+    return [valor for _, valor in heapq.nsmallest(RESULTADOS_BUSCA, achados)]
+
+def selectbox_pesquisavel(rotulo, coluna, opcoes, key, lista_completa=False, placeholder=None):
+    """Selectbox normal para listas pequenas; para listas grandes, pesquisa no servidor antes de montar as opções."""
+    if len(opcoes) <= LIMITE_OPCOES_NAVEGADOR:
+        return st.selectbox(rotulo, options=opcoes, index=None, placeholder=placeholder, key=key)
+    termo = st.text_input(
+        f"Pesquisar {rotulo}", key=f"busca_{key}", label_visibility="collapsed",
+        placeholder=f"🔎 Pesquisar entre {len(opcoes)} opções (digite um trecho e tecle Enter)",
+    )
+    resultados = buscar_opcoes(coluna, termo, opcoes, lista_completa)
+    atual = st.session_state.get(key)
+    if atual and atual not in resultados:
+        resultados.insert(0, atual)  # mantém a escolha feita mesmo se a pesquisa mudar
+    return st.selectbox(rotulo, options=resultados, index=None, placeholder=placeholder, key=key)
 
 def renderizar_logo(tamanho=180):
-    if os.path.exists("logo.png"):
-        with open("logo.png", "rb") as f:
-            encoded = base64.b64encode(f.read()).decode()
-            st.markdown(f'<div style="text-align: center; margin-bottom: 10px;"><img src="data:image/png;base64,{encoded}" width="{tamanho}"></div>', unsafe_allow_html=True)
+    logo = html_logo(tamanho)
+    if logo:
+        st.markdown(logo, unsafe_allow_html=True)
 
 # ==========================================
 # 6. CONTROLE DE SESSÃO E MEMÓRIA
@@ -114,11 +814,577 @@ if 'sucesso_movimentacao' not in st.session_state:
     st.session_state.sucesso_movimentacao = False
 if 'form_key' not in st.session_state:
     st.session_state.form_key = 0 
+if 'sucesso_solicitacao' not in st.session_state:
+    st.session_state.sucesso_solicitacao = False
+if 'pagina_historico' not in st.session_state:
+    st.session_state.pagina_historico = 0
+if 'lote' not in st.session_state:
+    st.session_state.lote = None
+if 'sucesso_lote' not in st.session_state:
+    st.session_state.sucesso_lote = 0
+if 'gravacoes_pendentes' not in st.session_state:
+    st.session_state.gravacoes_pendentes = []
 
 def fazer_logout():
     st.session_state.usuario_logado = None
     st.session_state.pagina = 'login'
 
+# ==========================================
+# 6.1 FILA DE E-MAILS (ENVIO EM SEGUNDO PLANO)
+# ==========================================
+TENTATIVAS_EMAIL = 4
+ESPERA_INICIAL_EMAIL = 2  # segundos; dobra a cada nova tentativa
+OCIOSIDADE_SMTP = 60  # segundos sem e-mails antes de fechar a conexão reaproveitada
+
+def config_smtp():
+    """Lê os dados do SMTP no cofre de segredos (precisa rodar na thread do script)."""
+    return {
+        'servidor': st.secrets["SERVIDOR_SMTP"],
+        'porta': int(st.secrets.get("PORTA_SMTP", 587)),
+        'starttls': bool(st.secrets.get("SMTP_STARTTLS", True)),
+        'remetente': st.secrets["EMAIL_REMETENTE"],
+        'senha': st.secrets["SENHA_REMETENTE"].replace(" ", ""),
+    }
+
+def fechar_conexao_smtp(fila):
+    if fila['conexao'] is not None:
+        try:
+            fila['conexao'].quit()
+        except Exception:
+            pass
+    fila['conexao'] = None
+    fila['conexao_cfg'] = None
+
+def obter_conexao_smtp(fila, cfg):
+    """Reaproveita a sessão SMTP já autenticada; abre uma nova se o servidor ou o remetente mudaram."""
+    chave = (cfg['servidor'], cfg['porta'], cfg['remetente'])
+    if fila['conexao'] is not None and fila['conexao_cfg'] != chave:
+        fechar_conexao_smtp(fila)
+    if fila['conexao'] is None:
+        server = smtplib.SMTP(cfg['servidor'], cfg['porta'], timeout=30)
+        if cfg['starttls']:
+            server.starttls()
+        if cfg['senha']:
+            server.login(cfg['remetente'], cfg['senha'])
+        fila['conexao'] = server
+        fila['conexao_cfg'] = chave
+    return fila['conexao']
+
+def processar_fila_emails(fila):
+    while True:
+        try:
+            envio = fila['pendentes'].get(timeout=OCIOSIDADE_SMTP)
+        except queue.Empty:
+            fechar_conexao_smtp(fila)
+            continue
+
+        status = fila['status'][envio['id']]
+        for tentativa in range(1, TENTATIVAS_EMAIL + 1):
+            status['tentativas'] = tentativa
+            try:
+                with medir("smtp_envio", USUARIO_SEGUNDO_PLANO, fila['metricas']):
+                    server = obter_conexao_smtp(fila, envio['cfg'])
+                    server.sendmail(envio['cfg']['remetente'], envio['destinatarios'], envio['mensagem'])
+                status['estado'] = 'enviado'
+                break
+            except Exception as email_err:
+                # Conexão pode ter caído: descarta e reconecta na próxima tentativa
+                fechar_conexao_smtp(fila)
+                status['erro'] = str(email_err)
+                if tentativa < TENTATIVAS_EMAIL:
+                    time.sleep(ESPERA_INICIAL_EMAIL * 2 ** (tentativa - 1))
+        else:
+            status['estado'] = 'falhou'
+
+@st.cache_resource
+def iniciar_fila_emails():
+    """Fila única do servidor, compartilhada por todas as sessões, com uma thread que envia os e-mails."""
+    fila = {'pendentes': queue.Queue(), 'status': {}, 'conexao': None, 'conexao_cfg': None, 'metricas': metricas_desempenho()}
+    threading.Thread(target=processar_fila_emails, args=(fila,), name="fila-emails", daemon=True).start()
+    return fila
+
+def enfileirar_email(cfg, destinatarios, assunto, corpo, fila=None):
+    """Coloca o e-mail na fila e devolve o id usado para acompanhar o status do envio."""
+    fila = fila or iniciar_fila_emails()
+    msg = MIMEMultipart()
+    msg['From'] = cfg['remetente']
+    msg['To'] = ", ".join(destinatarios)
+    msg['Subject'] = assunto
+    msg.attach(MIMEText(corpo, 'plain'))
+
+    id_envio = uuid.uuid4().hex
+    fila['status'][id_envio] = {'estado': 'pendente', 'tentativas': 0, 'erro': ""}
+    fila['pendentes'].put({'id': id_envio, 'cfg': cfg, 'destinatarios': destinatarios, 'mensagem': msg.as_string()})
+    return id_envio
+
+@st.fragment(run_every=3)
+def acompanhar_gravacoes():
+    """Mostra quantos registros desta sessão ainda aguardam o Supabase e avisa quando são confirmados."""
+    status = status_envios(st.session_state.gravacoes_pendentes)
+    aguardando = 0
+    for id_envio in list(st.session_state.gravacoes_pendentes):
+        pendentes, recusados, erro = status.get(id_envio, (0, 0, None))
+        if pendentes:
+            aguardando += pendentes
+            continue
+        st.session_state.gravacoes_pendentes.remove(id_envio)
+        if recusados:
+            st.toast(f"❌ {recusados} registro(s) recusado(s) pelo banco de dados e encaminhado(s) ao administrador. ERRO: {erro}")
+        else:
+            st.toast("✅ Registro confirmado no banco de dados.")
+    if aguardando:
+        erros = [erro for pendentes, _, erro in status.values() if pendentes and erro]
+        aviso = f" Última falha: {erros[0]}" if erros else ""
+        st.caption(f"⏳ {aguardando} registro(s) aguardando confirmação do banco de dados.{aviso}")
+
+# ==========================================
+# 6.1.1 RESUMO PERIÓDICO DE POSTOS FALTANTES
+# ==========================================
+# Pedidos do mesmo posto (unidade/cc/subprocesso/gestor/cargo) viram uma única
+# solicitação aberta, e o RH recebe um e-mail-resumo por intervalo com a contagem
+# de pedidos de cada posto. As abertas ficam no SQLite da fila de gravações e num
+# índice em memória, consultado antes de qualquer gravação para recusar repetições.
+CAMPOS_POSTO_FALTANTE = ('unidade', 'centro_custo', 'subprocesso', 'gestor', 'cargo')
+INTERVALO_RESUMO_POSTOS = 30  # minutos; pode ser trocado pelo segredo INTERVALO_RESUMO_POSTOS
+PRAZO_SOLICITACAO_ABERTA = timedelta(days=7)  # já informada ao RH e sem pedidos novos por esse período, a solicitação fecha
+
+def chave_posto_faltante(dados):
+    return json.dumps([dados[campo] for campo in CAMPOS_POSTO_FALTANTE], ensure_ascii=False)
+
+def salvar_posto_faltante(conn, aberta):
+    conn.execute(
+        """INSERT OR REPLACE INTO postos_faltantes
+           (chave, unidade, centro_custo, subprocesso, gestor, cargo, solicitantes, quantidade, informados, primeira, ultima, resumo, quantidade_resumo)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+        (aberta['chave'], *[aberta[campo] for campo in CAMPOS_POSTO_FALTANTE], json.dumps(aberta['solicitantes'], ensure_ascii=False),
+         aberta['quantidade'], aberta['informados'], aberta['primeira'], aberta['ultima'], aberta['resumo'], aberta['quantidade_resumo']),
+    )
+
+def destino_resumo_postos():
+    """(cfg do SMTP, destinatários) lidos dos segredos; None se o e-mail do RH não estiver configurado."""
+    try:
+        return config_smtp(), [email.strip() for email in st.secrets["EMAIL_RH"].split(',')]
+    except (KeyError, FileNotFoundError):
+        return None
+
+def intervalo_resumo_postos():
+    """(segundos entre resumos, aviso); valores não positivos ou inválidos no segredo voltam ao padrão."""
+    valor = st.secrets.get("INTERVALO_RESUMO_POSTOS", INTERVALO_RESUMO_POSTOS)
+    try:
+        minutos = float(valor)
+    except (TypeError, ValueError):
+        minutos = 0
+    if minutos > 0:
+        return minutos * 60, None
+    return INTERVALO_RESUMO_POSTOS * 60, f"INTERVALO_RESUMO_POSTOS = {valor!r} não é um número positivo de minutos; usando {INTERVALO_RESUMO_POSTOS}."
+
+def registrar_posto_faltante(dados, usuario):
+    """Soma o pedido à solicitação aberta do mesmo posto ou abre uma nova.
+
+    Devolve ('nova' | 'somada' | 'repetida', solicitação); 'repetida' quando o
+    usuário já pediu esse posto e nada deve ser gravado.
+    """
+    motor = motor_resumo_postos()
+    chave = chave_posto_faltante(dados)
+    with motor['lock']:
+        aberta = motor['abertas'].get(chave)
+        if aberta is not None and usuario in aberta['solicitantes']:
+            return 'repetida', aberta
+        situacao = 'nova' if aberta is None else 'somada'
+        agora = datetime.now(fuso_br).isoformat()
+        if aberta is None:
+            aberta = {
+                'chave': chave, **{campo: dados[campo] for campo in CAMPOS_POSTO_FALTANTE},
+                'solicitantes': [], 'quantidade': 0, 'informados': 0, 'primeira': agora,
+                'resumo': None, 'quantidade_resumo': None,
+            }
+        aberta['solicitantes'].append(usuario)
+        aberta['quantidade'] += 1
+        aberta['ultima'] = agora
+        with closing(conexao_fila_gravacoes()) as conn, conn:
+            salvar_posto_faltante(conn, aberta)
+        motor['abertas'][chave] = aberta
+    return situacao, aberta
+
+def corpo_resumo_postos(abertas):
+    def formatar(data_iso):
+        return datetime.fromisoformat(data_iso).strftime('%d/%m/%Y %H:%M')
+
+    blocos = []
+    for aberta in abertas:
+        novos = aberta['quantidade'] - aberta['informados']
+        pedidos = f"{aberta['quantidade']}" + (f" ({novos} desde o último resumo)" if aberta['informados'] else "")
+        blocos.append(f"""- Unidade: {aberta['unidade']}
+- Centro de Custo: {aberta['centro_custo']}
+- Subprocesso: {aberta['subprocesso']}
+- Gestor Associado: {aberta['gestor']}
+- Cargo que ocupará o posto: {aberta['cargo']}
+- Pedidos: {pedidos}
+- Solicitantes: {", ".join(aberta['solicitantes'])}
+- Primeiro pedido: {formatar(aberta['primeira'])} | Último pedido: {formatar(aberta['ultima'])}""")
+    separador = "\n--------------------------------------------------\n"
+    return f"""
+Olá equipe do RH,
+
+Seguem as solicitações de criação de posto registradas no sistema de Movimentações de Headcount desde o último resumo.
+
+Postos solicitados: {len(abertas)}{separador}{separador.join(blocos)}{separador}
+Por favor, providencie o cadastro dos postos no sistema oficial para que as movimentações possam ser concluídas.
+
+Mensagem automática do Sistema de Headcount.
+"""
+
+def enviar_resumo_postos(motor):
+    """Confere o resultado do último resumo, fecha as solicitações vencidas e coloca na fila o próximo e-mail."""
+    status_emails = motor['fila_emails']['status']
+    limite = (datetime.now(fuso_br) - PRAZO_SOLICITACAO_ABERTA).isoformat()
+    concluidos = set()
+    with motor['lock'], closing(conexao_fila_gravacoes()) as conn, conn:
+        for chave, aberta in list(motor['abertas'].items()):
+            if aberta['resumo'] is not None:
+                status = status_emails.get(aberta['resumo'])
+                if status is not None and status['estado'] == 'pendente':
+                    continue
+                if status is not None and status['estado'] == 'enviado':
+                    aberta['informados'] = aberta['quantidade_resumo']
+                # Resumo que falhou: os pedidos voltam a ficar pendentes para o próximo
+                concluidos.add(aberta['resumo'])
+                aberta['resumo'] = aberta['quantidade_resumo'] = None
+                salvar_posto_faltante(conn, aberta)
+            if aberta['informados'] == aberta['quantidade'] and aberta['ultima'] < limite:
+                del motor['abertas'][chave]
+                conn.execute("DELETE FROM postos_faltantes WHERE chave = ?", (chave,))
+        for id_envio in concluidos:
+            status_emails.pop(id_envio, None)
+
+        pendentes = [a for a in motor['abertas'].values() if a['resumo'] is None and a['quantidade'] > a['informados']]
+        if not pendentes or motor['destino'] is None:
+            return None
+        pendentes.sort(key=lambda a: (-(a['quantidade'] - a['informados']), a['primeira']))
+        cfg, destinatarios = motor['destino']
+        id_envio = enfileirar_email(
+            cfg, destinatarios, f"🚨 Resumo de Postos Faltantes - Headcount ({len(pendentes)} posto(s))",
+            corpo_resumo_postos(pendentes), fila=motor['fila_emails'],
+        )
+        for aberta in pendentes:
+            aberta['resumo'] = id_envio
+            aberta['quantidade_resumo'] = aberta['quantidade']
+            salvar_posto_faltante(conn, aberta)
+    return id_envio
+
+def processar_resumo_postos(motor):
+    ultimo = time.monotonic()
+    while True:
+        # O aviso acorda a espera quando o intervalo muda nos segredos; o prazo é recalculado com o novo valor
+        motor['aviso'].wait(max(0, ultimo + motor['intervalo'] - time.monotonic()))
+        motor['aviso'].clear()
+        if time.monotonic() < ultimo + motor['intervalo']:
+            continue
+        ultimo = time.monotonic()
+        try:
+            enviar_resumo_postos(motor)
+            motor['erro'] = None
+        except Exception as e:
+            # Segue tentando no próximo intervalo; a tela de métricas mostra a falha
+            motor['erro'] = f"{datetime.now(fuso_br).strftime('%d/%m/%Y %H:%M')}: {e}"
+
+def motor_resumo_postos():
+    """Motor único por processo, como o servidor de métricas: depois de um st.cache_resource.clear()
+    continua a mesma thread e o mesmo índice, sem um segundo laço mandando o resumo em dobro."""
+    with SERVICOS_PROCESSO['lock']:
+        motor = SERVICOS_PROCESSO.get('resumo_postos')
+        if motor is None:
+            motor = SERVICOS_PROCESSO['resumo_postos'] = criar_motor_resumo_postos()
+        # Destino e intervalo são relidos dos segredos a cada rerun
+        intervalo, motor['aviso_intervalo'] = intervalo_resumo_postos()
+        if intervalo != motor['intervalo']:
+            motor['intervalo'] = intervalo
+            motor['aviso'].set()
+        motor['destino'] = destino_resumo_postos()
+    return motor
+
+def criar_motor_resumo_postos():
+    preparar_diario_gravacoes()  # garante o arquivo do diário em modo WAL
+    with closing(conexao_fila_gravacoes()) as conn, conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS postos_faltantes (
+                chave TEXT PRIMARY KEY,
+                unidade TEXT NOT NULL,
+                centro_custo TEXT NOT NULL,
+                subprocesso TEXT NOT NULL,
+                gestor TEXT NOT NULL,
+                cargo TEXT NOT NULL,
+                solicitantes TEXT NOT NULL,
+                quantidade INTEGER NOT NULL,
+                informados INTEGER NOT NULL DEFAULT 0,
+                primeira TEXT NOT NULL,
+                ultima TEXT NOT NULL,
+                resumo TEXT,
+                quantidade_resumo INTEGER
+            )
+        """)
+        # Resumos que estavam na fila de e-mails quando o processo parou são refeitos
+        conn.execute("UPDATE postos_faltantes SET resumo = NULL, quantidade_resumo = NULL WHERE resumo IS NOT NULL")
+        linhas = conn.execute("SELECT * FROM postos_faltantes").fetchall()
+    abertas = {}
+    for linha in linhas:
+        aberta = dict(linha)
+        aberta['solicitantes'] = json.loads(aberta['solicitantes'])
+        abertas[aberta['chave']] = aberta
+    motor = {
+        'lock': threading.Lock(), 'abertas': abertas, 'aviso': threading.Event(),
+        'intervalo': intervalo_resumo_postos()[0], 'aviso_intervalo': None, 'erro': None,
+        'destino': destino_resumo_postos(), 'fila_emails': iniciar_fila_emails(),
+    }
+    threading.Thread(target=processar_resumo_postos, args=(motor,), name="resumo-postos", daemon=True).start()
+    return motor
+
+motor_resumo_postos()
+
+# ==========================================
+# 6.2 HISTÓRICO (CACHE INCREMENTAL POR USUÁRIO)
+# ==========================================
+COLUNAS_HISTORICO = {
+    'id': "ID", 'data_registro': "Data", 'usuario_sistema': "Usuário", 'requisitante': "Requisitante",
+    'cc_saida': "CC Saída", 'qtd_saida': "Qtd Saída", 'cargo_saida': "Cargo Saída",
+    'cc_entrada': "CC Entrada", 'qtd_entrada': "Qtd Entrada", 'cargo_entrada': "Cargo Entrada",
+}
+TAMANHO_PAGINA_HISTORICO = 50
+
+@st.cache_resource
+def cache_historico():
+    # Compartilhado entre sessões: cada usuário guarda o trecho mais recente do seu histórico já baixado
+    return {'lock': threading.Lock(), 'usuarios': {}}
+
+def consultar_historico(usuario):
+    return supabase.table("movimentacoes").select(",".join(COLUNAS_HISTORICO)).eq("usuario_sistema", usuario)
+
+def contar_historico(usuario):
+    return supabase.table("movimentacoes").select("id", count="exact", head=True).eq("usuario_sistema", usuario).execute().count or 0
+
+def pagina_historico(usuario, pagina, total):
+    """Linhas da página pedida (mais recentes primeiro) e a movimentação mais recente do usuário.
+
+    Só busca no Supabase os ids novos e as páginas ainda não baixadas. total é a contagem atual
+    do usuário (contar_historico), usada para perceber registros que chegaram fora de ordem.
+    """
+    cache = cache_historico()
+    with cache['lock']:
+        hist = cache['usuarios'].setdefault(usuario, {'lock': threading.Lock(), 'linhas': [], 'fim': False, 'contagem': None})
+
+    with hist['lock']:
+        linhas = hist['linhas']
+
+        # 1. Movimentações registradas depois da última vista (id acima do maior id em cache).
+        # Com o histórico já baixado até o fim, roda mesmo sem linhas: quem não tinha nada na
+        # primeira visita precisa ver as movimentações que registrar depois.
+        if linhas or hist['fim']:
+            novas = []
+            cursor = linhas[0]['id'] if linhas else 0
+            while True:
+                lote = consultar_historico(usuario).gt("id", cursor).order("id").limit(TAMANHO_PAGINA_HISTORICO).execute().data
+                novas.extend(lote)
+                if len(lote) < TAMANHO_PAGINA_HISTORICO:
+                    break
+                cursor = lote[-1]['id']
+            linhas[:0] = reversed(novas)
+
+            # O id é reservado antes do commit: um registro com id menor que o maior em cache pode
+            # aparecer depois (outra réplica, lote da fila). Se a contagem cresceu mais do que os ids
+            # novos explicam, o trecho em cache está furado e é baixado de novo pelas páginas.
+            if hist['contagem'] is not None and total - hist['contagem'] != len(novas):
+                linhas.clear()
+                hist['fim'] = False
+        hist['contagem'] = total
+
+        # 2. Páginas mais antigas por keyset (id abaixo do menor id em cache) até cobrir a página pedida
+        fim_pagina = (pagina + 1) * TAMANHO_PAGINA_HISTORICO
+        while len(linhas) < fim_pagina and not hist['fim']:
+            consulta = consultar_historico(usuario).order("id", desc=True).limit(TAMANHO_PAGINA_HISTORICO)
+            if linhas:
+                consulta = consulta.lt("id", linhas[-1]['id'])
+            lote = consulta.execute().data
+            linhas.extend(lote)
+            if len(lote) < TAMANHO_PAGINA_HISTORICO:
+                hist['fim'] = True
+
+        mais_recente = linhas[0] if linhas else None
+        return linhas[pagina * TAMANHO_PAGINA_HISTORICO:fim_pagina], mais_recente
+
+# ==========================================
+# 6.2.1 SALDO LÍQUIDO DE HEADCOUNT (ENTRADAS - SAÍDAS)
+# ==========================================
+CHAVE_SALDO = ['unidade', 'cc', 'cargo']
+COLUNAS_ORIGEM_SALDO = ['id', 'unidade_saida', 'cc_saida', 'cargo_saida', 'qtd_saida', 'unidade_entrada', 'cc_entrada', 'cargo_entrada', 'qtd_entrada']
+LOTE_SALDO = 1000  # linhas por requisição (limite padrão do PostgREST)
+INTERVALO_SALDO = 30  # segundos entre buscas de movimentações novas, feitas em segundo plano
+ESPERA_ATUALIZAR_SALDO = 10  # segundos que o botão Atualizar saldo aguarda a thread antes de mostrar o que houver
+# O id é reservado antes do commit: um lote da fila de gravações (até 500 linhas, possivelmente
+# de outro servidor) pode ficar visível depois de um id maior já lido. Cada atualização relê
+# essa faixa abaixo do último id e pula os ids já somados.
+JANELA_SALDO = 5000
+
+def saldo_vazio():
+    return pd.DataFrame(
+        {'entradas': pd.Series(dtype='int64'), 'saidas': pd.Series(dtype='int64')},
+        index=pd.MultiIndex.from_arrays([[], [], []], names=CHAVE_SALDO),
+    )
+
+def agregar_saldo(df):
+    """Soma vetorizada de um lote de movimentações por (unidade, cc, cargo)."""
+    lados = {}
+    for lado, coluna in (('saida', 'saidas'), ('entrada', 'entradas')):
+        qtd = pd.to_numeric(df[f'qtd_{lado}'], errors='coerce').fillna(0).astype('int64')
+        soma = qtd.groupby([df[f'unidade_{lado}'], df[f'cc_{lado}'], df[f'cargo_{lado}']]).sum()
+        soma.index.names = CHAVE_SALDO
+        lados[coluna] = soma
+    return pd.DataFrame(lados, columns=['entradas', 'saidas']).fillna(0).astype('int64')
+
+def atualizar_saldo(motor):
+    """Incorpora à tabela materializada as movimentações ainda não somadas (ids novos e os que chegaram atrasados).
+
+    Só a thread do motor chama esta função; as telas leem o resultado publicado sob o lock.
+    """
+    pedido = motor['pedidos']  # cliques em Atualizar saldo feitos antes desta busca são atendidos por ela
+    saldo, ultimo_id = motor['saldo'], motor['ultimo_id']
+    with medir("saldo_atualizacao", USUARIO_SEGUNDO_PLANO, motor['metricas']):
+        cursor = max(0, ultimo_id - JANELA_SALDO)
+        while True:
+            lote = (supabase.table("movimentacoes").select(",".join(COLUNAS_ORIGEM_SALDO))
+                    .gt("id", cursor).order("id").limit(LOTE_SALDO).execute().data)
+            if not lote:
+                break
+            novos = [linha for linha in lote if linha['id'] not in motor['processados']]
+            if novos:
+                delta = agregar_saldo(pd.DataFrame(novos, columns=COLUNAS_ORIGEM_SALDO))
+                saldo = saldo.add(delta, fill_value=0).astype('int64')
+                motor['processados'].update(linha['id'] for linha in novos)
+            cursor = lote[-1]['id']
+            ultimo_id = max(ultimo_id, cursor)
+            # Só os ids dentro da janela precisam ser lembrados
+            piso = ultimo_id - JANELA_SALDO
+            motor['processados'] = {i for i in motor['processados'] if i > piso}
+            if len(lote) < LOTE_SALDO:
+                break
+    with motor['lock']:
+        motor['saldo'], motor['ultimo_id'], motor['pronto'], motor['atendidos'] = saldo, ultimo_id, True, pedido
+
+def processar_saldo(motor):
+    while True:
+        try:
+            atualizar_saldo(motor)
+            motor['erro'] = None
+        except Exception as e:
+            motor['erro'] = str(e)  # segue com o último saldo publicado até o próximo ciclo
+        motor['aviso'].wait(INTERVALO_SALDO)
+        motor['aviso'].clear()
+
+def motor_saldo():
+    """Tabela materializada compartilhada por todas as sessões e atualizada por uma thread única por
+    processo (a carga inicial varre a tabela inteira e não pode ficar no rerun de quem abre a consulta)."""
+    with SERVICOS_PROCESSO['lock']:
+        motor = SERVICOS_PROCESSO.get('saldo')
+        if motor is None:
+            motor = SERVICOS_PROCESSO['saldo'] = {
+                'lock': threading.Lock(), 'saldo': saldo_vazio(), 'ultimo_id': 0, 'processados': set(),
+                'pronto': False, 'pedidos': 0, 'atendidos': 0, 'erro': None, 'aviso': threading.Event(), 'metricas': metricas_desempenho(),
+            }
+            threading.Thread(target=processar_saldo, args=(motor,), name="saldo-headcount", daemon=True).start()
+        motor['metricas'] = metricas_desempenho()
+    return motor
+
+def pedir_atualizacao_saldo():
+    """Acorda a thread do saldo e espera a atualização seguinte (até ESPERA_ATUALIZAR_SALDO segundos)."""
+    motor = motor_saldo()
+    with motor['lock']:
+        motor['pedidos'] += 1
+        pedido = motor['pedidos']
+    motor['aviso'].set()
+    limite = time.monotonic() + ESPERA_ATUALIZAR_SALDO
+    while motor['atendidos'] < pedido and time.monotonic() < limite:
+        time.sleep(0.1)
+
+def saldo_publicado():
+    """(saldo, último id somado, pronto, erro) da última atualização, sem consultar o Supabase."""
+    motor = motor_saldo()
+    with motor['lock']:
+        return motor['saldo'], motor['ultimo_id'], motor['pronto'], motor['erro']
+
+def tabela_saldo(saldo, unidade=None):
+    """Saldo pronto para exibir/exportar, opcionalmente filtrado por unidade."""
+    df = saldo.reset_index()
+    if unidade:
+        df = df[df['unidade'] == unidade]
+    df = df.assign(saldo=df['entradas'] - df['saidas']).sort_values(['unidade', 'cc', 'cargo'])
+    df.columns = ["Unidade", "Centro de Custo", "Cargo", "Entradas", "Saídas", "Saldo"]
+    return df
+
+# ==========================================
+# 6.3 MOVIMENTAÇÕES EM LOTE (GRADE E IMPORTAÇÃO DE PLANILHA)
+# ==========================================
+CAMPOS_CAMINHO = [('unidade', "Unidade"), ('cc', "CC"), ('subprocesso', "Subprocesso"), ('gestor', "Gestor"), ('posto', "Posto"), ('cargo', "Cargo")]
+COLUNAS_LOTE = {'requisitante': "Requisitante"}
+for _lado, _nome in (('saida', "Saída"), ('entrada', "Entrada")):
+    COLUNAS_LOTE.update({f"{campo}_{_lado}": f"{rotulo} {_nome}" for campo, rotulo in CAMPOS_CAMINHO})
+    COLUNAS_LOTE[f"qtd_{_lado}"] = f"Qtd {_nome}"
+
+def lote_vazio():
+    return pd.DataFrame({coluna: pd.Series(dtype="Int64" if coluna.startswith("qtd_") else str) for coluna in COLUNAS_LOTE})
+
+@st.cache_data
+def modelo_lote_csv():
+    return lote_vazio().rename(columns=COLUNAS_LOTE).to_csv(index=False, sep=";").encode("utf-8-sig")
+
+def ler_planilha_lote(arquivo):
+    """Lê um CSV/XLSX de movimentações, aceitando tanto os cabeçalhos do modelo quanto os nomes das colunas do banco."""
+    if arquivo.name.lower().endswith(".csv"):
+        df = pd.read_csv(arquivo, dtype=str, sep=None, engine="python", encoding="utf-8-sig")
+    else:
+        df = pd.read_excel(arquivo, dtype=str)
+    df.columns = [str(c).strip() for c in df.columns]
+    df = df.rename(columns={rotulo: coluna for coluna, rotulo in COLUNAS_LOTE.items()})
+    faltando = [COLUNAS_LOTE[c] for c in COLUNAS_LOTE if c not in df.columns]
+    if faltando:
+        raise ValueError(f"Colunas ausentes na planilha: {', '.join(faltando)}")
+    df = df[list(COLUNAS_LOTE)].fillna("")
+    for lado in ('saida', 'entrada'):
+        df[f"qtd_{lado}"] = pd.to_numeric(df[f"qtd_{lado}"].replace("", "1"), errors="coerce").astype("Int64")
+    return df
+
+def validar_lote(df):
+    """Confere todas as linhas contra o catálogo de parâmetros de uma vez. Devolve (registros, erros)."""
+    requisitantes = set(indice_cascata['requisitantes'])
+    registros, erros = [], []
+    for numero, linha in enumerate(df.to_dict("records"), start=1):
+        linha = {c: ("" if pd.isna(v) else (v.strip() if isinstance(v, str) else v)) for c, v in linha.items()}
+        if all(linha[c] == "" for c in COLUNAS_LOTE if not c.startswith("qtd_")):
+            continue  # linha em branco da grade
+
+        problemas = []
+        if linha['requisitante'] not in requisitantes:
+            problemas.append("Requisitante não encontrado")
+        for lado, nome in (('saida', "Saída"), ('entrada', "Entrada")):
+            caminho = []
+            for campo, rotulo in CAMPOS_CAMINHO:
+                valor = linha[f"{campo}_{lado}"]
+                if valor not in opcoes_cascata(*caminho):
+                    problemas.append(f"{rotulo} ({nome}) inválido" if valor else f"{rotulo} ({nome}) não preenchido")
+                    break
+                caminho.append(valor)
+            try:
+                qtd = int(linha[f"qtd_{lado}"])
+            except (TypeError, ValueError):
+                qtd = 0
+            if qtd < 1:
+                problemas.append(f"Quantidade ({nome}) deve ser um número maior que zero")
+            linha[f"qtd_{lado}"] = qtd
+
+        if problemas:
+            erros.append({"Linha": numero, "Problemas": "; ".join(problemas)})
+        else:
+            registros.append(linha)
+    return registros, erros
+
 # ==========================================
 # 7. MODAL: CADASTRAR POSTO FALTANTE E E-MAIL
 # ==========================================
@@ -126,21 +1392,18 @@ def fazer_logout():
 def modal_solicitar_posto():
     st.markdown("<p style='color: black;'>Preencha os dados abaixo.</p>", unsafe_allow_html=True)
     
-    und_p = st.selectbox("Unidade:", options=sorted([x for x in df_parametros['unidade'].unique() if x]), index=None)
-    df_cc_p = df_parametros[df_parametros['unidade'] == und_p] if und_p else pd.DataFrame(columns=df_parametros.columns)
-    cc_p = st.selectbox("Centro de Custo:", options=sorted([x for x in df_cc_p['cc'].unique() if x]), index=None)
-    df_sub_p = df_cc_p[df_cc_p['cc'] == cc_p] if cc_p else pd.DataFrame(columns=df_parametros.columns)
-    sub_p = st.selectbox("Subprocesso:", options=sorted([x for x in df_sub_p['sub'].unique() if x]), index=None)
-    df_gestor_p = df_sub_p[df_sub_p['sub'] == sub_p] if sub_p else pd.DataFrame(columns=df_parametros.columns)
-    gestor_p = st.selectbox("Gestor:", options=sorted([x for x in df_gestor_p['gestor'].unique() if x]), index=None)
-    cargo_p = st.selectbox("Qual Cargo deve pertencer a esse posto?:", options=sorted([x for x in df_parametros['cargo'].unique() if x]), index=None)
+    und_p = st.selectbox("Unidade:", options=opcoes_cascata(), index=None)
+    cc_p = st.selectbox("Centro de Custo:", options=opcoes_cascata(und_p), index=None)
+    sub_p = st.selectbox("Subprocesso:", options=opcoes_cascata(und_p, cc_p), index=None)
+    gestor_p = st.selectbox("Gestor:", options=opcoes_cascata(und_p, cc_p, sub_p), index=None)
+    cargo_p = selectbox_pesquisavel("Qual Cargo deve pertencer a esse posto?:", 'cargo', indice_cascata['cargos'], key="cargo_p", lista_completa=True)
 
     st.write("")
-    if st.button("ENVIAR SOLICITAÇÃO", use_container_width=True):
+    if st.button("ENVIAR SOLICITAÇÃO", use_container_width=True, key="btn_enviar_solicitacao"):
         if not all([und_p, cc_p, sub_p, gestor_p, cargo_p]):
             st.error("Por favor, preencha todos os campos antes de enviar.")
         else:
-            with st.spinner("Salvando no banco e enviando e-mail para o RH..."):
+            with st.spinner("Salvando a solicitação..."):
                 try:
                     data_atual = datetime.now(fuso_br).isoformat()
                     
@@ -154,66 +1417,26 @@ def modal_solicitar_posto():
                         "gestor": gestor_p,
                         "cargo": cargo_p
                     }
-                    supabase.table("solicitacoes_postos").insert(dados_solicitacao).execute()
-                    
-                    # 2. DISPARA O E-MAIL
-                    erro_real_do_email = ""
-                    try:
-                        remetente = st.secrets["EMAIL_REMETENTE"]
-                        senha = st.secrets["SENHA_REMETENTE"].replace(" ", "")
-                        destinatario = st.secrets["EMAIL_RH"] 
-                        servidor_smtp = st.secrets["SERVIDOR_SMTP"]
-                        
-                        msg = MIMEMultipart()
-                        msg['From'] = remetente
-                        msg['To'] = destinatario
-                        msg['Subject'] = "🚨 Nova Solicitação de Posto Faltante - Headcount"
-                        
-                        corpo_email = f"""
-Olá equipe do RH,
-
-Uma nova solicitação de criação de posto foi registrada no sistema de Movimentações de Headcount.
-
-Detalhes da Solicitação:
---------------------------------------------------
-- Solicitante: {st.session_state.usuario_logado}
-- Unidade: {und_p}
-- Centro de Custo: {cc_p}
-- Subprocesso: {sub_p}
-- Gestor Associado: {gestor_p}
-- Cargo que ocupará o posto: {cargo_p}
---------------------------------------------------
-
-Por favor, providencie o cadastro do posto no sistema oficial para que a movimentação possa ser concluída.
-
-Mensagem automática do Sistema de Headcount.
-"""
-                        msg.attach(MIMEText(corpo_email, 'plain'))
-                        
-                        lista_destinatarios = [email.strip() for email in destinatario.split(',')]
-                        
-                        server = smtplib.SMTP(servidor_smtp, 587)
-                        server.starttls()
-                        server.login(remetente, senha)
-                        server.sendmail(remetente, lista_destinatarios, msg.as_string())
-                        server.quit()
-                        email_sucesso = True
-                    except Exception as email_err:
-                        erro_real_do_email = str(email_err)
-                        email_sucesso = False
-
-                    # 3. FEEDBACK FINAL
-                    if email_sucesso:
-                        st.success("✅ Solicitação salva e E-mail enviado com sucesso!")
-                        time.sleep(2)
-                    else:
-                        st.warning(f"⚠️ Salvo no Supabase, mas falhou ao enviar e-mail. ERRO: {erro_real_do_email}")
-                        time.sleep(6)
-                    
-                    st.rerun()
-
+                    # Pedido repetido é recusado pelo índice em memória, antes de gravar qualquer coisa
+                    situacao, aberta = registrar_posto_faltante(dados_solicitacao, st.session_state.usuario_logado)
+                    if situacao == 'repetida':
+                        st.warning(f"⚠️ Você já solicitou este posto em {datetime.fromisoformat(aberta['primeira']).strftime('%d/%m/%Y %H:%M')} e o pedido ainda está em aberto com o RH.")
+                        return
+                    id_envio = enfileirar_gravacoes("solicitacoes_postos", [dados_solicitacao], st.session_state.usuario_logado)
+                    st.session_state.gravacoes_pendentes.append(id_envio)
                 except Exception as e:
-                    st.error(f"Erro ao salvar na nuvem (Supabase): {e}")
+                    st.error(f"Erro ao salvar a solicitação: {e}")
+                    return
+
+            # 2. O E-MAIL SAI NO PRÓXIMO RESUMO PERIÓDICO PARA O RH
+            if motor_resumo_postos()['destino'] is None:
+                st.warning("⚠️ Solicitação salva, mas o e-mail do RH não está configurado para receber o resumo.")
+                return
+            if situacao == 'somada':
+                st.session_state.sucesso_solicitacao = f"✅ Solicitação salva! Este posto já havia sido pedido; seu pedido foi somado aos demais ({aberta['quantidade']} no total) e vai no próximo resumo enviado ao RH."
+            else:
+                st.session_state.sucesso_solicitacao = "✅ Solicitação salva! Ela vai no próximo resumo de postos faltantes enviado ao RH."
+            st.rerun()
 
 # ==========================================
 # 8. TELAS DO APLICATIVO
@@ -234,7 +1457,7 @@ if st.session_state.usuario_logado is None:
                 usuario = st.text_input("Usuário")
                 senha = st.text_input("Senha", type="password")
                 st.write("<br>", unsafe_allow_html=True)
-                submit = st.form_submit_button("ACESSAR SISTEMA", use_container_width=True)
+                submit = st.form_submit_button("ACESSAR SISTEMA", use_container_width=True, key="btn_acessar")
                 
                 if submit:
                     if usuario in USUARIOS_PERMITIDOS and USUARIOS_PERMITIDOS[usuario] == senha:
@@ -246,94 +1469,97 @@ if st.session_state.usuario_logado is None:
 
 # --- TELAS INTERNAS ---
 else:
-    col_titulo, col_user, col_btn1, col_btn2 = st.columns([4, 2, 2, 1.5])
+    col_titulo, col_user, col_btn1, col_btn_lote, col_btn2 = st.columns([4, 2, 2, 2, 1.5])
     
     with col_titulo:
         st.markdown("<h2 style='color: black; margin-top: -15px;'>Sistema de Movimentações</h2>", unsafe_allow_html=True)
     with col_user:
         st.write(f"👤 Logado como: **{st.session_state.usuario_logado}**")
+        if st.session_state.usuario_logado in ADMINISTRADORES and st.session_state.pagina != 'metricas':
+            if st.button("📊 Métricas", key="btn_metricas"):
+                st.session_state.pagina = 'metricas'
+                st.rerun()
     with col_btn1:
         if st.session_state.pagina == 'registro':
-            if st.button("Ver Histórico (Consultas)", use_container_width=True):
+            if st.button("Ver Histórico (Consultas)", use_container_width=True, key="btn_historico"):
                 st.session_state.pagina = 'consulta'
+                st.session_state.pagina_historico = 0
                 st.rerun()
         else:
-            if st.button("Nova Movimentação", use_container_width=True):
+            if st.button("Nova Movimentação", use_container_width=True, key="btn_nova"):
                 st.session_state.pagina = 'registro'
                 st.rerun()
+    with col_btn_lote:
+        if st.session_state.pagina != 'lote':
+            if st.button("Movimentação em Lote", use_container_width=True, key="btn_lote"):
+                st.session_state.pagina = 'lote'
+                st.rerun()
+        else:
+            if st.button("Ver Histórico (Consultas)", use_container_width=True, key="btn_historico"):
+                st.session_state.pagina = 'consulta'
+                st.session_state.pagina_historico = 0
+                st.rerun()
     with col_btn2:
-        if st.button("Sair", use_container_width=True):
+        if st.button("Sair", use_container_width=True, key="btn_sair"):
             fazer_logout()
             st.rerun()
 
     st.divider()
 
+    if st.session_state.gravacoes_pendentes:
+        acompanhar_gravacoes()
+
     # --- TELA PRINCIPAL (REGISTRO) ---
     if st.session_state.pagina == 'registro':
         
         if st.session_state.sucesso_movimentacao:
             st.success("✅ Movimentação registrada com sucesso!")
             st.session_state.sucesso_movimentacao = False 
+        if st.session_state.sucesso_solicitacao:
+            st.success(st.session_state.sucesso_solicitacao)
+            st.session_state.sucesso_solicitacao = False
         
         fk = st.session_state.form_key 
-        lista_req = sorted([x for x in df_parametros['requisitante'].unique() if x])
-        requisitante = st.selectbox("Quem solicitou a troca? (Pode digitar para pesquisar)", options=lista_req, index=None, placeholder="Selecione o requisitante...", key=f"req_{fk}")
+        lista_req = indice_cascata['requisitantes']
+        requisitante = selectbox_pesquisavel("Quem solicitou a troca? (Pode digitar para pesquisar)", 'requisitante', lista_req, key=f"req_{fk}", lista_completa=True, placeholder="Selecione o requisitante...")
 
         st.write("") 
         col_saida, col_entrada = st.columns(2, gap="large")
 
         # ==== LADO ESQUERDO: SAÍDA ====
-        with col_saida:
+        with col_saida, medir("cascata_saida"):
             with st.container(border=True):
-                st.markdown("""
-                <div style="background-color: #fff5f5; border: 2px solid #ffcdd2; border-radius: 8px; padding: 12px; margin-bottom: 15px;">
-                    <h4 style="text-align: center; color: #b71c1c; margin: 0;">VAGA DE SAÍDA (RETIRADA)</h4>
-                </div>
-                """, unsafe_allow_html=True)
+                st.markdown(HTML_CABECALHO_SAIDA, unsafe_allow_html=True)
                 
-                s_und = st.selectbox("Unidade (Saída):", options=sorted([x for x in df_parametros['unidade'].unique() if x]), index=None, key=f"s_und_{fk}")
-                df_s_cc = df_parametros[df_parametros['unidade'] == s_und] if s_und else pd.DataFrame(columns=df_parametros.columns)
-                s_cc = st.selectbox("Centro de Custo (Saída):", options=sorted([x for x in df_s_cc['cc'].unique() if x]), index=None, key=f"s_cc_{fk}")
-                df_s_sub = df_s_cc[df_s_cc['cc'] == s_cc] if s_cc else pd.DataFrame(columns=df_parametros.columns)
-                s_sub = st.selectbox("Subprocesso (Saída):", options=sorted([x for x in df_s_sub['sub'].unique() if x]), index=None, key=f"s_sub_{fk}")
-                df_s_gestor = df_s_sub[df_s_sub['sub'] == s_sub] if s_sub else pd.DataFrame(columns=df_parametros.columns)
-                s_gestor = st.selectbox("Gestor (Saída):", options=sorted([x for x in df_s_gestor['gestor'].unique() if x]), index=None, key=f"s_gestor_{fk}")
-                df_s_posto = df_s_gestor[df_s_gestor['gestor'] == s_gestor] if s_gestor else pd.DataFrame(columns=df_parametros.columns)
-                s_posto = st.selectbox("Posto (Saída):", options=sorted([x for x in df_s_posto['posto'].unique() if x]), index=None, key=f"s_posto_{fk}")
-                df_s_cargo = df_s_posto[df_s_posto['posto'] == s_posto] if s_posto else pd.DataFrame(columns=df_parametros.columns)
-                s_cargo = st.selectbox("Cargo (Saída):", options=sorted([x for x in df_s_cargo['cargo'].unique() if x]), index=None, key=f"s_cargo_{fk}")
+                s_und = st.selectbox("Unidade (Saída):", options=opcoes_cascata(), index=None, key=f"s_und_{fk}")
+                s_cc = st.selectbox("Centro de Custo (Saída):", options=opcoes_cascata(s_und), index=None, key=f"s_cc_{fk}")
+                s_sub = st.selectbox("Subprocesso (Saída):", options=opcoes_cascata(s_und, s_cc), index=None, key=f"s_sub_{fk}")
+                s_gestor = st.selectbox("Gestor (Saída):", options=opcoes_cascata(s_und, s_cc, s_sub), index=None, key=f"s_gestor_{fk}")
+                s_posto = selectbox_pesquisavel("Posto (Saída):", 'posto', opcoes_cascata(s_und, s_cc, s_sub, s_gestor), key=f"s_posto_{fk}")
+                s_cargo = selectbox_pesquisavel("Cargo (Saída):", 'cargo', opcoes_cascata(s_und, s_cc, s_sub, s_gestor, s_posto), key=f"s_cargo_{fk}")
                 s_qtd = st.number_input("Quantidade (Saída):", min_value=1, value=1, step=1, key=f"s_qtd_{fk}")
 
         # ==== LADO DIREITO: ENTRADA ====
-        with col_entrada:
+        with col_entrada, medir("cascata_entrada"):
             with st.container(border=True):
-                st.markdown("""
-                <div style="background-color: #f1f8e9; border: 2px solid #c8e6c9; border-radius: 8px; padding: 12px; margin-bottom: 15px;">
-                    <h4 style="text-align: center; color: #1b5e20; margin: 0;">VAGA DE ENTRADA (NOVA)</h4>
-                </div>
-                """, unsafe_allow_html=True)
+                st.markdown(HTML_CABECALHO_ENTRADA, unsafe_allow_html=True)
                 
-                e_und = st.selectbox("Unidade (Entrada):", options=sorted([x for x in df_parametros['unidade'].unique() if x]), index=None, key=f"e_und_{fk}")
-                df_e_cc = df_parametros[df_parametros['unidade'] == e_und] if e_und else pd.DataFrame(columns=df_parametros.columns)
-                e_cc = st.selectbox("Centro de Custo (Entrada):", options=sorted([x for x in df_e_cc['cc'].unique() if x]), index=None, key=f"e_cc_{fk}")
-                df_e_sub = df_e_cc[df_e_cc['cc'] == e_cc] if e_cc else pd.DataFrame(columns=df_parametros.columns)
-                e_sub = st.selectbox("Subprocesso (Entrada):", options=sorted([x for x in df_e_sub['sub'].unique() if x]), index=None, key=f"e_sub_{fk}")
-                df_e_gestor = df_e_sub[df_e_sub['sub'] == e_sub] if e_sub else pd.DataFrame(columns=df_parametros.columns)
-                e_gestor = st.selectbox("Gestor (Entrada):", options=sorted([x for x in df_e_gestor['gestor'].unique() if x]), index=None, key=f"e_gestor_{fk}")
-                df_e_posto = df_e_gestor[df_e_gestor['gestor'] == e_gestor] if e_gestor else pd.DataFrame(columns=df_parametros.columns)
-                e_posto = st.selectbox("Posto (Entrada):", options=sorted([x for x in df_e_posto['posto'].unique() if x]), index=None, key=f"e_posto_{fk}")
-                df_e_cargo = df_e_posto[df_e_posto['posto'] == e_posto] if e_posto else pd.DataFrame(columns=df_parametros.columns)
-                e_cargo = st.selectbox("Cargo (Entrada):", options=sorted([x for x in df_e_cargo['cargo'].unique() if x]), index=None, key=f"e_cargo_{fk}")
+                e_und = st.selectbox("Unidade (Entrada):", options=opcoes_cascata(), index=None, key=f"e_und_{fk}")
+                e_cc = st.selectbox("Centro de Custo (Entrada):", options=opcoes_cascata(e_und), index=None, key=f"e_cc_{fk}")
+                e_sub = st.selectbox("Subprocesso (Entrada):", options=opcoes_cascata(e_und, e_cc), index=None, key=f"e_sub_{fk}")
+                e_gestor = st.selectbox("Gestor (Entrada):", options=opcoes_cascata(e_und, e_cc, e_sub), index=None, key=f"e_gestor_{fk}")
+                e_posto = selectbox_pesquisavel("Posto (Entrada):", 'posto', opcoes_cascata(e_und, e_cc, e_sub, e_gestor), key=f"e_posto_{fk}")
+                e_cargo = selectbox_pesquisavel("Cargo (Entrada):", 'cargo', opcoes_cascata(e_und, e_cc, e_sub, e_gestor, e_posto), key=f"e_cargo_{fk}")
                 e_qtd = st.number_input("Quantidade (Entrada):", min_value=1, value=1, step=1, key=f"e_qtd_{fk}")
                 
                 st.write("")
-                if st.button("Não encontrou o posto? Clique aqui para solicitar", use_container_width=True):
+                if st.button("Não encontrou o posto? Clique aqui para solicitar", use_container_width=True, key="btn_solicitar_posto"):
                     modal_solicitar_posto()
 
         st.write("")
         
         # ==== BOTÃO SALVAR (NO SUPABASE) ====
-        if st.button("✅ CONFIRMAR MOVIMENTAÇÃO", use_container_width=True):
+        if st.button("✅ CONFIRMAR MOVIMENTAÇÃO", use_container_width=True, key="btn_confirmar"):
             if not requisitante:
                 st.warning("⚠️ O campo Requisitante é obrigatório.")
             elif not all([s_und, s_cc, s_sub, s_gestor, s_posto, s_cargo, e_und, e_cc, e_sub, e_gestor, e_posto, e_cargo]):
@@ -352,51 +1578,206 @@ else:
                         "gestor_entrada": e_gestor, "posto_entrada": e_posto, "cargo_entrada": e_cargo, "qtd_entrada": e_qtd
                     }
                     
-                    supabase.table("movimentacoes").insert(dados_movimentacao).execute()
+                    # Vai para a fila local; a confirmação do Supabase chega em segundo plano
+                    id_envio = enfileirar_gravacoes("movimentacoes", [dados_movimentacao], st.session_state.usuario_logado)
+                    st.session_state.gravacoes_pendentes.append(id_envio)
                     
                     st.session_state.sucesso_movimentacao = True
                     st.session_state.form_key += 1 
                     st.rerun()
                 except Exception as e:
-                    st.error(f"Erro ao salvar no Supabase: {e}")
+                    st.error(f"Erro ao salvar a movimentação: {e}")
+
+    # --- TELA DE MOVIMENTAÇÃO EM LOTE ---
+    elif st.session_state.pagina == 'lote':
+
+        if st.session_state.sucesso_lote:
+            st.success(f"✅ {st.session_state.sucesso_lote} movimentações registradas com sucesso!")
+            st.session_state.sucesso_lote = 0
+
+        if st.session_state.lote is None:
+            st.session_state.lote = lote_vazio()
+
+        fk = st.session_state.form_key
+        st.markdown("#### Movimentações em Lote")
+        st.caption("Preencha a grade (uma linha por troca de Saída → Entrada) ou importe uma planilha CSV/XLSX no formato do modelo.")
+
+        col_upload, col_modelo = st.columns([3, 1])
+        with col_upload:
+            arquivo_lote = st.file_uploader("Importar planilha", type=["csv", "xlsx"], key=f"arquivo_lote_{fk}")
+        with col_modelo:
+            st.write("")
+            st.download_button("Baixar modelo (CSV)", data=modelo_lote_csv(), file_name="modelo_movimentacoes.csv", mime="text/csv", use_container_width=True)
+
+        if arquivo_lote is not None and st.session_state.get('arquivo_lote_id') != arquivo_lote.file_id:
+            try:
+                st.session_state.lote = ler_planilha_lote(arquivo_lote)
+                st.session_state.arquivo_lote_id = arquivo_lote.file_id
+                st.rerun()
+            except Exception as e:
+                st.error(f"Não foi possível ler a planilha: {e}")
+
+        df_lote = st.data_editor(
+            st.session_state.lote,
+            num_rows="dynamic",
+            use_container_width=True,
+            hide_index=True,
+            column_config={
+                coluna: st.column_config.NumberColumn(rotulo, min_value=1, step=1, default=1) if coluna.startswith("qtd_") else st.column_config.TextColumn(rotulo)
+                for coluna, rotulo in COLUNAS_LOTE.items()
+            },
+            key=f"grade_lote_{fk}",
+        )
+
+        st.write("")
+        if st.button("✅ CONFIRMAR LOTE", use_container_width=True, key="btn_confirmar_lote"):
+            registros, erros = validar_lote(df_lote)
+            if erros:
+                st.warning(f"⚠️ {len(erros)} linha(s) com problemas. Nada foi salvo; corrija e confirme novamente.")
+                st.dataframe(pd.DataFrame(erros), use_container_width=True, hide_index=True)
+            elif not registros:
+                st.warning("⚠️ Adicione ao menos uma movimentação à grade.")
+            else:
+                try:
+                    data_atual = datetime.now(fuso_br).isoformat()
+                    dados_lote = [
+                        {"usuario_sistema": st.session_state.usuario_logado, "data_registro": data_atual, **registro}
+                        for registro in registros
+                    ]
+                    # Uma única transação local; a fila envia o lote inteiro ao Supabase de uma vez
+                    id_envio = enfileirar_gravacoes("movimentacoes", dados_lote, st.session_state.usuario_logado)
+                    st.session_state.gravacoes_pendentes.append(id_envio)
+
+                    st.session_state.sucesso_lote = len(dados_lote)
+                    st.session_state.lote = None
+                    st.session_state.form_key += 1
+                    st.rerun()
+                except Exception as e:
+                    st.error(f"Erro ao salvar as movimentações: {e}")
 
     # --- TELA DE CONSULTA (DO SUPABASE) ---
     elif st.session_state.pagina == 'consulta':
-        try:
-            resposta = supabase.table("movimentacoes").select("*").eq("usuario_sistema", st.session_state.usuario_logado).order("id", desc=True).execute()
-            df_historico = pd.DataFrame(resposta.data)
-            
-            if not df_historico.empty:
-                df_historico = df_historico[['id', 'data_registro', 'usuario_sistema', 'requisitante', 'cc_saida', 'qtd_saida', 'cargo_saida', 'cc_entrada', 'qtd_entrada', 'cargo_entrada']]
-                df_historico.columns = ["ID", "Data", "Usuário", "Requisitante", "CC Saída", "Qtd Saída", "Cargo Saída", "CC Entrada", "Qtd Entrada", "Cargo Entrada"]
+        aba_historico, aba_saldo = st.tabs(["Minhas Movimentações", "Saldo de Headcount"])
+
+        with aba_historico:
+            try:
+                usuario = st.session_state.usuario_logado
+                with medir("supabase_consulta"):
+                    total = contar_historico(usuario)
+                    total_paginas = max(1, -(-total // TAMANHO_PAGINA_HISTORICO))
+                    pagina = min(st.session_state.pagina_historico, total_paginas - 1)
+                    linhas, mais_recente = pagina_historico(usuario, pagina, total)
+
+                df_historico = pd.DataFrame(linhas, columns=list(COLUNAS_HISTORICO))
+                df_historico.columns = list(COLUNAS_HISTORICO.values())
                 df_historico['Data'] = pd.to_datetime(df_historico['Data']).dt.strftime('%d/%m/%Y %H:%M')
+                ultima = pd.to_datetime(mais_recente['data_registro']).strftime('%d/%m/%Y %H:%M') if mais_recente else "-"
 
-                total = len(df_historico)
-                ultima = df_historico['Data'].iloc[0]
-            else:
-                df_historico = pd.DataFrame(columns=["ID", "Data", "Usuário", "Requisitante", "CC Saída", "Qtd Saída", "Cargo Saída", "CC Entrada", "Qtd Entrada", "Cargo Entrada"])
-                total = 0
-                ultima = "-"
+                col_metric1, col_metric2 = st.columns(2)
+                col_metric1.metric("TOTAL REGISTRADO", total)
+                col_metric2.metric("ÚLTIMA MOVIMENTAÇÃO", ultima)
 
-            col_metric1, col_metric2 = st.columns(2)
-            col_metric1.metric("TOTAL REGISTRADO", total)
-            col_metric2.metric("ÚLTIMA MOVIMENTAÇÃO", ultima)
+                st.markdown("#### Suas Movimentações Cadastradas")
+                aguardando = pendentes_usuario(usuario, "movimentacoes")
+                if aguardando:
+                    st.info(f"⏳ {aguardando} movimentação(ões) ainda sendo enviada(s) ao banco; aparecerão aqui assim que confirmadas.")
+                    
+                if total > 0:
+                    # Estilo fixo por coluna, aplicado só às linhas da página atual
+                    df_estilizado = (df_historico.style
+                        .set_properties(subset=["CC Saída", "Qtd Saída", "Cargo Saída"], **{'background-color': '#ffebee', 'color': '#b71c1c'})
+                        .set_properties(subset=["CC Entrada", "Qtd Entrada", "Cargo Entrada"], **{'background-color': '#e8f5e9', 'color': '#1b5e20'}))
+                    st.dataframe(df_estilizado, use_container_width=True, hide_index=True)
 
-            st.markdown("#### Suas Movimentações Cadastradas")
-            
-            def colorir_tabela(coluna):
-                if coluna.name in ["CC Saída", "Qtd Saída", "Cargo Saída"]:
-                    return ['background-color: #ffebee; color: #b71c1c'] * len(coluna)
-                elif coluna.name in ["CC Entrada", "Qtd Entrada", "Cargo Entrada"]:
-                    return ['background-color: #e8f5e9; color: #1b5e20'] * len(coluna)
+                    if total_paginas > 1:
+                        col_ant, col_pag, col_prox = st.columns([1, 2, 1])
+                        if col_ant.button("⬅ Mais recentes", use_container_width=True, disabled=pagina == 0):
+                            st.session_state.pagina_historico = pagina - 1
+                            st.rerun()
+                        col_pag.markdown(f"<p style='text-align: center;'>Página {pagina + 1} de {total_paginas}</p>", unsafe_allow_html=True)
+                        if col_prox.button("Mais antigas ➡", use_container_width=True, disabled=pagina >= total_paginas - 1):
+                            st.session_state.pagina_historico = pagina + 1
+                            st.rerun()
                 else:
-                    return [''] * len(coluna)
-                    
-            if total > 0:
-                df_estilizado = df_historico.style.apply(colorir_tabela)
-                st.dataframe(df_estilizado, use_container_width=True, hide_index=True)
-            else:
-                st.info("Você ainda não possui movimentações registradas.")
+                    st.info("Você ainda não possui movimentações registradas.")
                 
-        except Exception as e:
-            st.error(f"Erro ao puxar dados do banco de dados: {e}")
+            except Exception as e:
+                st.error(f"Erro ao puxar dados do banco de dados: {e}")
+
+        with aba_saldo:
+            try:
+                if st.button("🔄 Atualizar saldo", key="btn_atualizar_saldo"):
+                    pedir_atualizacao_saldo()
+                saldo, ultimo_id, pronto, erro_saldo = saldo_publicado()
+                if erro_saldo:
+                    st.warning(f"⚠️ Não foi possível buscar as movimentações mais recentes; o saldo pode estar desatualizado. ERRO: {erro_saldo}")
+                if not pronto:
+                    st.info("⏳ O saldo está sendo calculado pela primeira vez neste servidor. Clique em Atualizar saldo em alguns segundos.")
+                else:
+                    und_saldo = st.selectbox("Unidade:", options=sorted(saldo.index.unique('unidade')), index=None, placeholder="Todas as unidades", key="und_saldo")
+                    df_saldo = tabela_saldo(saldo, und_saldo)
+
+                    col_ent, col_sai, col_liq = st.columns(3)
+                    col_ent.metric("ENTRADAS", int(df_saldo["Entradas"].sum()))
+                    col_sai.metric("SAÍDAS", int(df_saldo["Saídas"].sum()))
+                    col_liq.metric("SALDO LÍQUIDO", int(df_saldo["Saldo"].sum()))
+
+                    if df_saldo.empty:
+                        st.info("Nenhuma movimentação registrada ainda.")
+                    else:
+                        st.bar_chart(df_saldo.groupby("Centro de Custo")["Saldo"].sum())
+                        st.dataframe(df_saldo, use_container_width=True, hide_index=True)
+                        st.download_button(
+                            "Exportar saldo (CSV)", data=df_saldo.to_csv(index=False, sep=";").encode("utf-8-sig"),
+                            file_name="saldo_headcount.csv", mime="text/csv", use_container_width=True,
+                        )
+                    st.caption(f"Considera as movimentações até o ID {ultimo_id}.")
+            except Exception as e:
+                st.error(f"Erro ao calcular o saldo de headcount: {e}")
+
+    # --- TELA DE MÉTRICAS (SOMENTE ADMINISTRADORES) ---
+    elif st.session_state.pagina == 'metricas':
+        if st.session_state.usuario_logado not in ADMINISTRADORES:
+            st.error("Acesso restrito aos administradores.")
+        else:
+            if erro_servidor_metricas:
+                st.warning(f"⚠️ {erro_servidor_metricas}")
+            resumo_postos = motor_resumo_postos()
+            if resumo_postos['aviso_intervalo']:
+                st.warning(f"⚠️ {resumo_postos['aviso_intervalo']}")
+            if resumo_postos['erro']:
+                st.warning(f"⚠️ O último resumo de postos faltantes falhou em {resumo_postos['erro']}")
+            if sincronizacao_parametros is not None and sincronizacao_parametros['erro']:
+                versao = sincronizacao_parametros['versao']
+                em_uso = f"da versão {versao} do Supabase" if versao is not None else "do parametros.xlsx"
+                st.warning(
+                    f"⚠️ A sincronização do catálogo com a tabela {sincronizacao_parametros['tabela']} falha desde "
+                    f"{sincronizacao_parametros['erro_desde'].strftime('%d/%m/%Y %H:%M')}; o app segue com o catálogo {em_uso}. "
+                    f"ERRO: {sincronizacao_parametros['erro']}"
+                )
+            st.markdown("#### Tempo por Etapa (todos os usuários)")
+            st.dataframe(resumo_metricas(por_usuario=False), use_container_width=True, hide_index=True)
+            st.markdown("#### Tempo por Etapa e Usuário")
+            st.dataframe(resumo_metricas(), use_container_width=True, hide_index=True)
+
+            recusadas = gravacoes_recusadas()
+            if not recusadas.empty:
+                st.markdown("#### Registros Recusados pelo Banco de Dados")
+                st.error(f"⚠️ {len(recusadas)} registro(s) ficaram fora do Supabase. Corrija a causa (coluna, restrição ou dado) e reenvie.")
+                st.dataframe(recusadas, use_container_width=True, hide_index=True)
+                if st.button("Reenviar registros recusados", key="btn_reenviar_recusados"):
+                    reenviar_gravacoes_recusadas()
+                    st.rerun()
+
+            col_prom, col_zerar = st.columns(2)
+            col_prom.download_button("Baixar no formato Prometheus", data=texto_prometheus(), file_name="metricas.prom", mime="text/plain", use_container_width=True)
+            if col_zerar.button("Zerar métricas", use_container_width=True):
+                metricas = metricas_desempenho()
+                with metricas['lock']:
+                    metricas['series'].clear()
+                st.rerun()
+            if st.secrets.get("PORTA_METRICAS"):
+                st.caption(f"Prometheus: coletar em http://<servidor>:{st.secrets['PORTA_METRICAS']}/metrics")
+
+# Reruns interrompidos por st.rerun() não chegam aqui; o tempo deles aparece nas etapas internas
+registrar_tempo(f"rerun:{st.session_state.pagina}", st.session_state.usuario_logado or "(anônimo)", time.perf_counter() - inicio_rerun)
@@ -0,0 +1,260 @@
+"""Benchmark do app.py com catálogos e históricos sintéticos.
+
+Gera parametros.xlsx sintéticos (1 mil, 100 mil e 1 milhão de linhas por
+padrão), roda o app.py pelo AppTest do Streamlit contra um Supabase falso e
+mede:
+
+- carga_fria_xlsx: primeira execução sem snapshot (leitura do Excel + índice)
+- carga_fria_snapshot: execução com caches limpos e snapshot já gerado
+- rerun_registro: rerun da tela de registro com tudo em cache
+- rerun_cascata: média por rerun ao escolher Unidade → Cargo na Saída
+- consulta_primeira: abertura da tela de consulta com o histórico sintético
+- consulta_rerun: rerun da tela de consulta já em cache
+
+Uso:
+    python -m desempenho.benchmark --saida baseline.json
+    python -m desempenho.benchmark --tamanhos 1000,100000 --comparar baseline.json
+
+O resultado é um JSON com a mediana de cada etapa (segundos) por tamanho;
+--comparar mostra a razão contra uma execução anterior e termina com código 1
+se alguma etapa ficou mais lenta que a tolerância.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from desempenho.dubles import SupabaseFalso
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP = os.path.join(RAIZ, "app.py")
+USUARIO = "benchmark"
+SEGREDOS = {
+    "SUPABASE_URL": "http://supabase-falso",
+    "SUPABASE_KEY": "chave-falsa",
+    "usuarios": {USUARIO: "senha"},
+}
+
+
+def gerar_catalogo(linhas, semente=42):
+    """Catálogo com distribuição parecida com o parametros.xlsx real.
+
+    Proporções do arquivo real: ~3 linhas por posto, ~5 postos por gestor,
+    1 subprocesso por gestor, ~3 subprocessos por CC e poucas unidades.
+    """
+    rng = np.random.default_rng(semente)
+    n_postos = max(1, linhas // 3)
+    n_gestores = max(1, n_postos // 5)
+    n_cc = max(1, n_gestores // 3)
+    n_unidades = max(2, min(50, 4 + linhas // 100_000))
+    n_cargos = max(5, min(5_000, linhas // 12))
+    n_requisitantes = max(5, min(20_000, linhas // 40))
+
+    posto = np.sort(rng.integers(0, n_postos, linhas))
+    gestor = posto * n_gestores // n_postos
+    cc = gestor * n_cc // n_gestores
+    unidade = cc * n_unidades // n_cc
+    cargo = (posto * 7919) % n_cargos
+    requisitante = rng.integers(0, n_requisitantes, linhas)
+    sem_posto = rng.random(linhas) < 0.05
+
+    def rotulos(prefixo, codigos):
+        return pd.Series(codigos).map(lambda c: f"{prefixo} {c:06d}")
+
+    df = pd.DataFrame({
+        "Unidade": rotulos("UNIDADE", unidade),
+        "Centro de Custo": rotulos("CC", cc),
+        "Subprocesso": rotulos("SUBPROCESSO", gestor),
+        "Gestor": rotulos("GESTOR", gestor),
+        "Posto": rotulos("POSTO", posto),
+        "Cargo": rotulos("CARGO", cargo),
+        "Requisitante": rotulos("REQUISITANTE", requisitante),
+    })
+    df.loc[sem_posto, "Posto"] = ""
+    return df
+
+
+def gerar_historico(linhas, semente=42):
+    rng = np.random.default_rng(semente)
+    inicio = pd.Timestamp("2025-01-01T08:00:00-03:00")
+    registros = []
+    for i in range(linhas):
+        registros.append({
+            "usuario_sistema": USUARIO,
+            "data_registro": (inicio + pd.Timedelta(minutes=int(i))).isoformat(),
+            "requisitante": f"REQUISITANTE {i % 997:06d}",
+            "unidade_saida": "UNIDADE 000000", "cc_saida": f"CC {i % 53:06d}", "subprocesso_saida": "SUBPROCESSO 000000",
+            "gestor_saida": "GESTOR 000000", "posto_saida": f"POSTO {i:06d}", "cargo_saida": f"CARGO {i % 211:06d}",
+            "qtd_saida": int(rng.integers(1, 4)),
+            "unidade_entrada": "UNIDADE 000001", "cc_entrada": f"CC {(i + 7) % 53:06d}", "subprocesso_entrada": "SUBPROCESSO 000001",
+            "gestor_entrada": "GESTOR 000001", "posto_entrada": f"POSTO {i + 1:06d}", "cargo_entrada": f"CARGO {(i + 3) % 211:06d}",
+            "qtd_entrada": int(rng.integers(1, 4)),
+        })
+    return registros
+
+
+def preparar_diretorio(base, linhas):
+    """Diretório de trabalho com o parametros.xlsx sintético (gerado uma vez e reaproveitado)."""
+    pasta = os.path.join(base, f"catalogo_{linhas}")
+    os.makedirs(pasta, exist_ok=True)
+    arquivo = os.path.join(pasta, "parametros.xlsx")
+    if not os.path.exists(arquivo):
+        print(f"  gerando catálogo sintético com {linhas} linhas...", flush=True)
+        gerar_catalogo(linhas).to_excel(arquivo, index=False)
+    return pasta
+
+
+def limpar_caches(pasta, apagar_snapshot):
+    import streamlit as st
+
+    st.cache_data.clear()
+    st.cache_resource.clear()
+    if apagar_snapshot:
+        for nome in os.listdir(pasta):
+            if nome.startswith("parametros.snapshot."):
+                os.remove(os.path.join(pasta, nome))
+
+
+def nova_sessao(pagina="registro"):
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP, default_timeout=600)
+    for chave, valor in SEGREDOS.items():
+        at.secrets[chave] = valor
+    at.session_state.usuario_logado = USUARIO
+    at.session_state.pagina = pagina
+    return at
+
+
+def cronometrar(at):
+    inicio = time.perf_counter()
+    at.run()
+    duracao = time.perf_counter() - inicio
+    if at.exception:
+        raise RuntimeError(f"app.py falhou no benchmark: {at.exception[0].message}")
+    return duracao
+
+
+def selecionar(at, rotulo):
+    caixa = next(s for s in at.selectbox if s.label == rotulo)
+    if not caixa.options:
+        return False
+    caixa.select(caixa.options[0])
+    return True
+
+
+def medir(linhas_catalogo, linhas_historico, repeticoes, base):
+    pasta = preparar_diretorio(base, linhas_catalogo)
+    cliente = SupabaseFalso()
+    cliente.popular("movimentacoes", gerar_historico(linhas_historico))
+    tempos = {etapa: [] for etapa in (
+        "carga_fria_xlsx", "carga_fria_snapshot", "rerun_registro", "rerun_cascata", "consulta_primeira", "consulta_rerun",
+    )}
+
+    diretorio_original = os.getcwd()
+    os.chdir(pasta)
+    try:
+        with mock.patch("supabase.create_client", lambda url, key: cliente):
+            for _ in range(repeticoes):
+                limpar_caches(pasta, apagar_snapshot=True)
+                at = nova_sessao()
+                tempos["carga_fria_xlsx"].append(cronometrar(at))
+
+                limpar_caches(pasta, apagar_snapshot=False)
+                at = nova_sessao()
+                tempos["carga_fria_snapshot"].append(cronometrar(at))
+                tempos["rerun_registro"].append(cronometrar(at))
+
+                reruns = []
+                for nivel in ("Unidade", "Centro de Custo", "Subprocesso", "Gestor", "Posto", "Cargo"):
+                    if not selecionar(at, f"{nivel} (Saída):"):
+                        break
+                    reruns.append(cronometrar(at))
+                tempos["rerun_cascata"].append(statistics.mean(reruns))
+
+                limpar_caches(pasta, apagar_snapshot=False)
+                cronometrar(nova_sessao())  # aquece o catálogo para isolar o custo da consulta
+                at = nova_sessao(pagina="consulta")
+                tempos["consulta_primeira"].append(cronometrar(at))
+                tempos["consulta_rerun"].append(cronometrar(at))
+    finally:
+        os.chdir(diretorio_original)
+    return {etapa: statistics.median(valores) for etapa, valores in tempos.items()}
+
+
+def commit_atual():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def comparar(atual, anterior, tolerancia):
+    """Imprime a razão atual/anterior por etapa; devolve as etapas que pioraram além da tolerância."""
+    piores = []
+    print(f"\n{'tamanho':>10} {'etapa':<22} {'anterior':>10} {'atual':>10} {'razão':>7}")
+    for tamanho, etapas in atual["resultados"].items():
+        base = anterior["resultados"].get(tamanho, {})
+        for etapa, segundos in etapas.items():
+            if etapa not in base:
+                continue
+            razao = segundos / base[etapa] if base[etapa] else float("inf")
+            marca = " <- mais lento" if razao > 1 + tolerancia else ""
+            print(f"{tamanho:>10} {etapa:<22} {base[etapa]:>10.4f} {segundos:>10.4f} {razao:>7.2f}{marca}")
+            if marca:
+                piores.append((tamanho, etapa))
+    return piores
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tamanhos", default="1000,100000,1000000", help="linhas dos catálogos sintéticos, separadas por vírgula")
+    parser.add_argument("--historico", type=int, default=100_000, help="teto de linhas do histórico sintético do usuário")
+    parser.add_argument("--repeticoes", type=int, default=3)
+    parser.add_argument("--pasta", default=os.path.join(RAIZ, ".benchmark"), help="onde guardar os catálogos gerados")
+    parser.add_argument("--saida", help="arquivo JSON para gravar os resultados")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior para comparação")
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="piora relativa aceita no --comparar (0.2 = 20%%)")
+    parser.add_argument("--limpar", action="store_true", help="apaga os catálogos gerados ao final")
+    args = parser.parse_args()
+
+    resultado = {
+        "commit": commit_atual(),
+        "data": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "repeticoes": args.repeticoes,
+        "resultados": {},
+    }
+    for tamanho in [int(t) for t in args.tamanhos.split(",")]:
+        historico = min(tamanho, args.historico)
+        print(f"catálogo {tamanho} linhas / histórico {historico} linhas", flush=True)
+        resultado["resultados"][str(tamanho)] = medir(tamanho, historico, args.repeticoes, args.pasta)
+        for etapa, segundos in resultado["resultados"][str(tamanho)].items():
+            print(f"  {etapa:<22} {segundos:.4f}s", flush=True)
+
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
+    if args.limpar:
+        shutil.rmtree(args.pasta, ignore_errors=True)
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            anterior = json.load(f)
+        if comparar(resultado, anterior, args.tolerancia):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
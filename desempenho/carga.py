@@ -0,0 +1,308 @@
+"""Teste de carga do app.py com várias sessões simultâneas.
+
+Simula N usuários do RH usando o app ao mesmo tempo no mesmo processo, como no
+servidor do Streamlit: uma thread por sessão, com o cliente do Supabase, o
+catálogo e os índices compartilhados. Cada sessão segue o roteiro:
+
+    login → cascata de Saída e Entrada → (posto faltante) → confirmar → consulta
+
+O Supabase e o SMTP são os dublês de desempenho.dubles, com latência
+configurável. Cada nível de concorrência roda em um processo novo (caches e
+memória limpos) e, depois de uma sessão de aquecimento, mede:
+
+- vazao_sessoes / vazao_reruns: roteiros completos e reruns por segundo
+- rerun_p50 / rerun_p90 / rerun_p99 / rerun_max: latência de cada rerun (segundos)
+- memoria_por_sessao_mb: crescimento do RSS do processo dividido pelo número de sessões
+- falhas: roteiros que terminaram com exceção ou sem confirmar a movimentação
+- gravados / emails: movimentações que chegaram ao Supabase falso e resumos recebidos pelo SMTP falso
+
+Uso:
+    python -m desempenho.carga --sessoes 1,5,10,25
+    python -m desempenho.carga --sessoes 10,50 --latencia 0.05 --saida carga.json
+"""
+import argparse
+import contextlib
+import gc
+import json
+import os
+import platform
+import resource
+import statistics
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from unittest import mock
+
+from desempenho.benchmark import APP, RAIZ, commit_atual, preparar_diretorio
+from desempenho.dubles import ServidorSMTPFalso, SupabaseFalso
+
+# Internos do Streamlit usados para fixar o estado global que o AppTest troca a cada run (ver
+# medir_nivel). Não são API pública: faltando algum, o teste de carga para com uma mensagem clara.
+# Testado com o Streamlit 1.66.
+INTERNOS_STREAMLIT = (
+    ("streamlit.runtime", "Runtime"),
+    ("streamlit.runtime.caching.storage.dummy_cache_storage", "MemoryCacheStorageManager"),
+    ("streamlit.runtime.dataframe_source_manager", "DataframeSourceManager"),
+    ("streamlit.runtime.scriptrunner.script_cache", "ScriptCache"),
+    ("streamlit.testing.v1.local_script_runner", "ScriptCache"),
+    ("streamlit.testing.v1.app_test", "patch_config_options"),
+    ("streamlit.testing.v1.util", "patch_config_options"),
+)
+NIVEIS_CASCATA = ("Unidade", "Centro de Custo", "Subprocesso", "Gestor", "Posto", "Cargo")
+ESPERA_GRAVACOES = 15  # segundos para a fila local e o resumo de postos chegarem aos dublês ao fim do nível
+
+
+def memoria_rss():
+    """RSS atual do processo em bytes (pico, se /proc não existir)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(p * len(ordenados)))]
+
+
+def verificar_streamlit():
+    """Interrompe o teste se a versão instalada do Streamlit não tiver os internos de INTERNOS_STREAMLIT."""
+    import importlib
+
+    import streamlit
+
+    faltando = []
+    for modulo, nome in INTERNOS_STREAMLIT:
+        try:
+            if not hasattr(importlib.import_module(modulo), nome):
+                faltando.append(f"{modulo}.{nome}")
+        except ImportError:
+            faltando.append(f"{modulo}.{nome}")
+    if faltando:
+        raise SystemExit(
+            f"O teste de carga não é compatível com o Streamlit {streamlit.__version__} instalado "
+            f"(faltam {', '.join(faltando)}). Use o Streamlit 1.66 ou mais recente."
+        )
+
+
+def runtime_compartilhado():
+    """Runtime falso único para todas as sessões, no lugar do que o AppTest cria e apaga a cada run."""
+    from unittest.mock import MagicMock
+
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+    from streamlit.runtime.dataframe_source_manager import DataframeSourceManager
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.dataframe_source_mgr = DataframeSourceManager()
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    try:  # registro dos componentes v2, que só existe nas versões mais novas
+        from streamlit.components.v2.component_manager import BidiComponentManager
+    except ImportError:
+        return runtime
+    componentes = BidiComponentManager()
+    componentes.discover_and_register_components(start_file_watching=False)
+    runtime.bidi_component_registry = componentes
+    return runtime
+
+
+class Sessao:
+    """Uma sessão do app dirigida pelo AppTest, cronometrando cada rerun."""
+
+    def __init__(self, usuario, segredos, tempos):
+        from streamlit.testing.v1 import AppTest
+
+        self.usuario = usuario
+        self.tempos = tempos
+        self.at = AppTest.from_file(APP, default_timeout=600)
+        for chave, valor in segredos.items():
+            self.at.secrets[chave] = valor
+
+    def rodar(self, reabrir_modal=False):
+        if reabrir_modal:
+            # O AppTest só mantém o st.dialog na tela se o botão que o abre for clicado de novo
+            self.at.button(key="btn_solicitar_posto").click()
+        inicio = time.perf_counter()
+        self.at.run()
+        self.tempos.append(time.perf_counter() - inicio)
+        if self.at.exception:
+            raise RuntimeError(self.at.exception[0].message)
+
+    def escolher(self, rotulo, indice, reabrir_modal=False):
+        caixa = next(s for s in self.at.selectbox if s.label == rotulo)
+        if caixa.options:
+            caixa.select(caixa.options[indice % len(caixa.options)])
+            self.rodar(reabrir_modal)
+
+    def roteiro(self, indice, com_posto):
+        self.rodar()
+        self.at.text_input[0].input(self.usuario)
+        self.at.text_input[1].input("senha")
+        self.at.button(key="btn_acessar").click()
+        self.rodar()
+
+        self.escolher("Quem solicitou a troca? (Pode digitar para pesquisar)", indice)
+        for lado, deslocamento in (("Saída", 0), ("Entrada", 1)):
+            for nivel in NIVEIS_CASCATA:
+                self.escolher(f"{nivel} ({lado}):", indice + deslocamento)
+
+        if com_posto:
+            self.rodar(reabrir_modal=True)
+            for rotulo in ("Unidade:", "Centro de Custo:", "Subprocesso:", "Gestor:", "Qual Cargo deve pertencer a esse posto?:"):
+                self.escolher(rotulo, indice, reabrir_modal=True)
+            self.at.button(key="btn_enviar_solicitacao").click()
+            self.rodar(reabrir_modal=True)
+            self.rodar()  # fecha o modal
+
+        self.at.button(key="btn_confirmar").click()
+        self.rodar()
+        if not any("Movimentação registrada" in s.value for s in self.at.success):
+            raise RuntimeError("movimentação não confirmada")
+
+        self.at.button(key="btn_historico").click()
+        self.rodar()
+
+
+def medir_nivel(sessoes, catalogo, latencia, com_posto, pasta_base):
+    """Roda `sessoes` roteiros simultâneos em um processo limpo e devolve as medidas do nível."""
+    import streamlit as st
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.runtime.secrets import Secrets
+    from streamlit.testing.v1.util import patch_config_options
+
+    pasta = preparar_diretorio(pasta_base, catalogo)
+    os.chdir(pasta)
+    for nome in os.listdir(pasta):
+        if nome.startswith("fila_gravacoes.db"):
+            os.remove(nome)
+
+    cliente = SupabaseFalso(latencia=latencia)
+    smtp = ServidorSMTPFalso(latencia=latencia).iniciar()
+    usuarios = [f"carga{i:04d}" for i in range(sessoes + 1)]
+    segredos = {
+        "SUPABASE_URL": "http://supabase-falso",
+        "SUPABASE_KEY": "chave-falsa",
+        "usuarios": {usuario: "senha" for usuario in usuarios},
+        "SERVIDOR_SMTP": "127.0.0.1",
+        "PORTA_SMTP": smtp.porta,
+        "SMTP_STARTTLS": False,
+        "EMAIL_REMETENTE": "headcount@teste.local",
+        "SENHA_REMETENTE": "",
+        "EMAIL_RH": "rh@teste.local",
+        "INTERVALO_RESUMO_POSTOS": 0.05,
+    }
+    # Todas as sessões usam os mesmos segredos: a troca global de st.secrets feita pelo AppTest fica inofensiva
+    st.secrets = Secrets()
+    st.secrets._secrets = segredos
+
+    # O AppTest ajusta estado global a cada run (runtime, configuração e compilação do script).
+    # Com sessões em paralelo, o fim de um run desfaria esse estado no meio do run de outra
+    # sessão; aqui ele é fixado uma vez para o nível inteiro. Como no servidor, o app.py é
+    # compilado uma vez só (compilar o mesmo arquivo em várias threads ao mesmo tempo quebra o compile()).
+    runtime = runtime_compartilhado()
+    cache_script = ScriptCache()
+    with mock.patch("supabase.create_client", lambda url, key: cliente), \
+            mock.patch.object(Runtime, "instance", classmethod(lambda cls: runtime)), \
+            mock.patch.object(Runtime, "exists", classmethod(lambda cls: True)), \
+            mock.patch("streamlit.testing.v1.local_script_runner.ScriptCache", lambda: cache_script), \
+            patch_config_options({"global.appTest": True}), \
+            mock.patch("streamlit.testing.v1.app_test.patch_config_options", lambda opcoes: contextlib.nullcontext()):
+        Sessao(usuarios[-1], segredos, []).roteiro(0, com_posto)  # aquece catálogo, índices e filas
+
+        gc.collect()
+        memoria_inicial = memoria_rss()
+        tempos, falhas = [], []
+        participantes = [Sessao(usuario, segredos, tempos) for usuario in usuarios[:sessoes]]
+        largada = threading.Barrier(sessoes)
+
+        def executar(indice, sessao):
+            largada.wait()
+            try:
+                sessao.roteiro(indice, com_posto)
+            except Exception as e:
+                falhas.append(f"{sessao.usuario}: {e}")
+
+        threads = [threading.Thread(target=executar, args=(i, s)) for i, s in enumerate(participantes)]
+        inicio = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        duracao = time.perf_counter() - inicio
+        gc.collect()
+        memoria_final = memoria_rss()
+
+        esperado = sessoes + 1 - len(falhas)
+        limite = time.monotonic() + ESPERA_GRAVACOES
+        def pendente():
+            return len(cliente.tabelas.get("movimentacoes", [])) < esperado or (com_posto and not smtp.mensagens)
+
+        while pendente() and time.monotonic() < limite:
+            time.sleep(0.5)
+
+    smtp.shutdown()
+    return {
+        "sessoes": sessoes,
+        "duracao": duracao,
+        "vazao_sessoes": (sessoes - len(falhas)) / duracao,
+        "vazao_reruns": len(tempos) / duracao,
+        "reruns": len(tempos),
+        "rerun_p50": statistics.median(tempos),
+        "rerun_p90": percentil(tempos, 0.90),
+        "rerun_p99": percentil(tempos, 0.99),
+        "rerun_max": max(tempos),
+        "memoria_por_sessao_mb": (memoria_final - memoria_inicial) / sessoes / 2**20,
+        "falhas": len(falhas),
+        "exemplos_falhas": falhas[:3],
+        "gravados": len(cliente.tabelas.get("movimentacoes", [])),
+        "emails": len(smtp.mensagens),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessoes", default="1,5,10,25", help="níveis de concorrência, separados por vírgula")
+    parser.add_argument("--catalogo", type=int, default=10_000, help="linhas do catálogo sintético")
+    parser.add_argument("--latencia", type=float, default=0.02, help="segundos de ida e volta simulados no Supabase e no SMTP")
+    parser.add_argument("--sem-posto", action="store_true", help="não inclui a solicitação de posto faltante no roteiro")
+    parser.add_argument("--pasta", default=os.path.join(RAIZ, ".benchmark"), help="onde guardar o catálogo gerado")
+    parser.add_argument("--saida", help="arquivo JSON para gravar os resultados")
+    args = parser.parse_args()
+    verificar_streamlit()
+
+    resultado = {
+        "commit": commit_atual(),
+        "data": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "catalogo": args.catalogo,
+        "latencia": args.latencia,
+        "niveis": [],
+    }
+    print(f"{'sessões':>8} {'sessões/s':>10} {'reruns/s':>9} {'p50':>8} {'p90':>8} {'p99':>8} {'MB/sessão':>10} {'falhas':>7}")
+    for sessoes in [int(n) for n in args.sessoes.split(",")]:
+        # Um processo novo por nível: caches frios e RSS sem sobras do nível anterior
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+            nivel = executor.submit(medir_nivel, sessoes, args.catalogo, args.latencia, not args.sem_posto, args.pasta).result()
+        resultado["niveis"].append(nivel)
+        print(
+            f"{sessoes:>8} {nivel['vazao_sessoes']:>10.2f} {nivel['vazao_reruns']:>9.1f} {nivel['rerun_p50']:>8.3f} "
+            f"{nivel['rerun_p90']:>8.3f} {nivel['rerun_p99']:>8.3f} {nivel['memoria_por_sessao_mb']:>10.2f} {nivel['falhas']:>7}",
+            flush=True,
+        )
+        for falha in nivel["exemplos_falhas"]:
+            print(f"         falha: {falha}")
+
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""Dublês locais do Supabase e do SMTP usados pelo benchmark e pelos testes de carga.
+
+O SupabaseFalso imita o pedaço da API do supabase-py que o app.py usa
+(table/select/eq/gt/lt/order/limit/insert/upsert/execute), guardando as
+tabelas em memória. Uma latência opcional simula a ida e volta ao PostgREST.
+
+O ServidorSMTPFalso escuta em 127.0.0.1, aceita qualquer remetente sem
+autenticação nem TLS e só guarda as mensagens recebidas.
+"""
+import socketserver
+import threading
+import time
+
+
+class RespostaFalsa:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+class ConsultaFalsa:
+    def __init__(self, banco, tabela):
+        self.banco = banco
+        self.tabela = tabela
+        self.colunas = None
+        self.contar = False
+        self.so_cabecalho = False
+        self.filtros = []
+        self.ordem = None
+        self.limite = None
+        self.gravar = None
+        self.conflito = None
+
+    def select(self, *colunas, count=None, head=None):
+        nomes = ",".join(colunas)
+        self.colunas = None if nomes in ("", "*") else nomes.split(",")
+        self.contar = count is not None
+        self.so_cabecalho = bool(head)
+        return self
+
+    def insert(self, dados, **kwargs):
+        self.gravar = dados if isinstance(dados, list) else [dados]
+        return self
+
+    def upsert(self, dados, on_conflict="", ignore_duplicates=False, **kwargs):
+        self.gravar = dados if isinstance(dados, list) else [dados]
+        self.conflito = on_conflict or None
+        return self
+
+    def eq(self, coluna, valor):
+        self.filtros.append(lambda r: r.get(coluna) == valor)
+        return self
+
+    def gt(self, coluna, valor):
+        self.filtros.append(lambda r: r.get(coluna) is not None and r[coluna] > valor)
+        return self
+
+    def gte(self, coluna, valor):
+        self.filtros.append(lambda r: r.get(coluna) is not None and r[coluna] >= valor)
+        return self
+
+    def lt(self, coluna, valor):
+        self.filtros.append(lambda r: r.get(coluna) is not None and r[coluna] < valor)
+        return self
+
+    def order(self, coluna, desc=False):
+        self.ordem = (coluna, desc)
+        return self
+
+    def limit(self, quantidade):
+        self.limite = quantidade
+        return self
+
+    def execute(self):
+        if self.banco.latencia:
+            time.sleep(self.banco.latencia)
+        with self.banco.lock:
+            linhas = self.banco.tabelas.setdefault(self.tabela, [])
+            if self.gravar is not None:
+                return RespostaFalsa(self.banco.gravar(self.tabela, self.gravar, self.conflito))
+
+            resultado = [r for r in linhas if all(f(r) for f in self.filtros)]
+        if self.ordem:
+            coluna, desc = self.ordem
+            # As tabelas já ficam em ordem de id; só reordena se pedirem outra coisa
+            if coluna != "id":
+                resultado.sort(key=lambda r: r.get(coluna), reverse=desc)
+            elif desc:
+                resultado.reverse()
+        total = len(resultado) if self.contar else None
+        if self.so_cabecalho:
+            return RespostaFalsa([], total)
+        if self.limite is not None:
+            resultado = resultado[:self.limite]
+        if self.colunas:
+            resultado = [{c: r.get(c) for c in self.colunas} for r in resultado]
+        return RespostaFalsa([dict(r) for r in resultado], total)
+
+
+class SupabaseFalso:
+    def __init__(self, latencia=0.0):
+        self.latencia = latencia
+        self.tabelas = {}
+        self.lock = threading.Lock()
+        self.proximo_id = {}
+        self.chaves = {}
+
+    def table(self, nome):
+        return ConsultaFalsa(self, nome)
+
+    def gravar(self, tabela, registros, conflito=None):
+        linhas = self.tabelas.setdefault(tabela, [])
+        gravados = []
+        existentes = self.chaves.setdefault((tabela, conflito), set()) if conflito else set()
+        for registro in registros:
+            if conflito and registro.get(conflito) in existentes:
+                continue  # ignore_duplicates
+            existentes.add(registro.get(conflito))
+            novo = dict(registro)
+            novo["id"] = self.proximo_id.get(tabela, len(linhas) + 1)
+            self.proximo_id[tabela] = novo["id"] + 1
+            linhas.append(novo)
+            gravados.append(novo)
+        return gravados
+
+    def popular(self, tabela, registros):
+        """Carrega registros iniciais sem passar pela latência simulada."""
+        with self.lock:
+            return self.gravar(tabela, registros)
+
+    def alterar(self, tabela, id_linha, **campos):
+        """UPDATE de uma linha; se a tabela tiver a coluna versao, ela recebe o próximo valor, como faz o gatilho do catálogo."""
+        with self.lock:
+            linhas = self.tabelas.setdefault(tabela, [])
+            linha = next(r for r in linhas if r["id"] == id_linha)
+            linha.update(campos)
+            if "versao" in linha:
+                linha["versao"] = max(r.get("versao") or 0 for r in linhas) + 1
+            return dict(linha)
+
+
+class SessaoSMTPFalsa(socketserver.StreamRequestHandler):
+    def responder(self, linha):
+        self.wfile.write(linha.encode() + b"\r\n")
+
+    def handle(self):
+        self.responder("220 smtp-falso")
+        while True:
+            comando = self.rfile.readline()
+            if not comando:
+                return
+            verbo = comando.decode(errors="replace").strip().split(" ")[0].upper()
+            if verbo == "EHLO":
+                self.responder("250-smtp-falso")
+                self.responder("250 8BITMIME")
+            elif verbo == "DATA":
+                self.responder("354 fim com <CRLF>.<CRLF>")
+                linhas = []
+                while (linha := self.rfile.readline()) not in (b".\r\n", b".\n", b""):
+                    linhas.append(linha[1:] if linha.startswith(b"..") else linha)
+                if self.server.latencia:
+                    time.sleep(self.server.latencia)
+                with self.server.lock:
+                    self.server.mensagens.append(b"".join(linhas))
+                self.responder("250 OK")
+            elif verbo == "QUIT":
+                self.responder("221 tchau")
+                return
+            else:  # HELO, MAIL, RCPT, RSET, NOOP
+                self.responder("250 OK")
+
+
+class ServidorSMTPFalso(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, porta=0, latencia=0.0):
+        super().__init__(("127.0.0.1", porta), SessaoSMTPFalsa)
+        self.latencia = latencia
+        self.mensagens = []
+        self.lock = threading.Lock()
+
+    @property
+    def porta(self):
+        return self.server_address[1]
+
+    def iniciar(self):
+        threading.Thread(target=self.serve_forever, name="smtp-falso", daemon=True).start()
+        return self
@@ -0,0 +1,246 @@
+"""Exportação incremental de movimentacoes e solicitacoes_postos para o Power BI.
+
+Em vez de o Power BI baixar a tabela inteira (?select=*) a cada atualização,
+este job grava arquivos em uma pasta que o Power BI lê com o conector Pasta:
+
+    <saida>/<tabela>/snapshot/parte-00001.csv ...   cópia completa (--completo)
+    <saida>/<tabela>/delta/delta-<id inicial>-<id final>.csv   só o que entrou desde a última execução
+    <saida>/<tabela>/cursor.json                    último id exportado e os ids recentes já exportados
+
+Os registros são lidos do Supabase em lotes por keyset (id > cursor), e cada lote
+é escrito e descartado antes de buscar o próximo: a tabela nunca fica inteira em
+memória. O cursor só avança depois que o arquivo foi gravado por completo, e cada
+execução relê os últimos JANELA_EXPORTACAO ids para pegar registros que ficaram
+visíveis no banco depois de um id maior.
+
+Uso:
+    python exportar_bi.py --saida /dados/bi --completo     # primeira carga
+    python exportar_bi.py --saida /dados/bi                # execuções agendadas
+    python exportar_bi.py --saida /dados/bi --formato parquet --completo
+
+Os deltas seguem o formato gravado no cursor pela última cópia completa; para trocar
+de formato, rode de novo com --completo.
+
+As credenciais vêm de SUPABASE_URL/SUPABASE_KEY no ambiente ou do
+.streamlit/secrets.toml do app.
+"""
+import argparse
+import csv
+import json
+import os
+import shutil
+import tomllib
+from datetime import datetime, timedelta, timezone
+
+fuso_br = timezone(timedelta(hours=-3))
+
+# tabela -> coluna de data usada para registrar o período coberto por cada arquivo
+TABELAS_EXPORTACAO = {
+    "movimentacoes": "data_registro",
+    "solicitacoes_postos": "data_solicitacao",
+}
+LOTE_EXPORTACAO = 1000  # limite padrão de linhas por requisição do PostgREST
+# O id é reservado antes do commit: um lote gravado pelo app pode ficar visível depois de um id
+# maior já exportado. Cada delta relê essa faixa abaixo do cursor e pula os ids já exportados,
+# guardados no cursor.json.
+JANELA_EXPORTACAO = 5000
+
+
+def conectar_supabase():
+    from supabase import create_client
+
+    url, chave = os.environ.get("SUPABASE_URL"), os.environ.get("SUPABASE_KEY")
+    if not (url and chave):
+        with open(os.path.join(".streamlit", "secrets.toml"), "rb") as f:
+            segredos = tomllib.load(f)
+        url, chave = segredos["SUPABASE_URL"], segredos["SUPABASE_KEY"]
+    return create_client(url, chave)
+
+
+def ler_lotes(cliente, tabela, desde_id, lote=LOTE_EXPORTACAO):
+    """Gera os registros com id > desde_id em lotes ordenados por id."""
+    cursor = desde_id
+    while True:
+        registros = cliente.table(tabela).select("*").gt("id", cursor).order("id").limit(lote).execute().data
+        if not registros:
+            return
+        yield registros
+        cursor = registros[-1]["id"]
+        if len(registros) < lote:
+            return
+
+
+class EscritorCSV:
+    def __init__(self, caminho, separador):
+        self.arquivo = open(caminho, "w", newline="", encoding="utf-8-sig")
+        self.separador = separador
+        self.escritor = None
+
+    def escrever(self, registros):
+        if self.escritor is None:
+            self.escritor = csv.DictWriter(self.arquivo, fieldnames=list(registros[0]), delimiter=self.separador, extrasaction="ignore")
+            self.escritor.writeheader()
+        self.escritor.writerows(registros)
+
+    def fechar(self):
+        self.arquivo.close()
+
+
+class EscritorParquet:
+    """Um row group por lote; o esquema sai do primeiro lote (id e qtd_* inteiros, o resto texto)."""
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self.escritor = None
+        self.esquema = None
+
+    def escrever(self, registros):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        if self.escritor is None:
+            self.esquema = pa.schema([
+                (coluna, pa.int64() if coluna == "id" or coluna.startswith("qtd_") else pa.string()) for coluna in registros[0]
+            ])
+            self.escritor = pq.ParquetWriter(self.caminho, self.esquema)
+        texto = [c.name for c in self.esquema if pa.types.is_string(c.type)]
+        linhas = [{**r, **{c: None if r.get(c) is None else str(r[c]) for c in texto}} for r in registros]
+        self.escritor.write_table(pa.Table.from_pylist(linhas, schema=self.esquema))
+
+    def fechar(self):
+        if self.escritor is not None:
+            self.escritor.close()
+
+
+def novo_escritor(caminho, formato, separador):
+    return EscritorParquet(caminho) if formato == "parquet" else EscritorCSV(caminho, separador)
+
+
+def lembrar_ids(recentes, registros, ultimo_id):
+    """Acrescenta os ids exportados e esquece os que já saíram da janela abaixo de ultimo_id."""
+    recentes.update(r["id"] for r in registros)
+    piso = ultimo_id - JANELA_EXPORTACAO
+    return {i for i in recentes if i > piso}
+
+
+def ler_cursor(pasta_tabela):
+    caminho = os.path.join(pasta_tabela, "cursor.json")
+    if not os.path.exists(caminho):
+        return {"ultimo_id": 0}
+    with open(caminho, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def gravar_cursor(pasta_tabela, cursor):
+    caminho = os.path.join(pasta_tabela, "cursor.json")
+    with open(caminho + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(cursor, f, ensure_ascii=False, indent=2)
+    os.replace(caminho + ".tmp", caminho)
+
+
+def exportar_completo(cliente, tabela, pasta_tabela, formato="csv", separador=";", linhas_por_parte=100_000):
+    """Regrava a cópia completa em partes de até linhas_por_parte linhas e reinicia o cursor e os deltas."""
+    temporaria = os.path.join(pasta_tabela, "snapshot.tmp")
+    shutil.rmtree(temporaria, ignore_errors=True)
+    os.makedirs(temporaria)
+
+    coluna_data = TABELAS_EXPORTACAO[tabela]
+    parte, linhas_na_parte, total, escritor = 0, 0, 0, None
+    ultimo_id, ultima_data, recentes = 0, None, set()
+    for registros in ler_lotes(cliente, tabela, 0):
+        if escritor is None or linhas_na_parte >= linhas_por_parte:
+            if escritor is not None:
+                escritor.fechar()
+            parte += 1
+            linhas_na_parte = 0
+            escritor = novo_escritor(os.path.join(temporaria, f"parte-{parte:05d}.{formato}"), formato, separador)
+        escritor.escrever(registros)
+        linhas_na_parte += len(registros)
+        total += len(registros)
+        ultimo_id, ultima_data = registros[-1]["id"], registros[-1].get(coluna_data)
+        recentes = lembrar_ids(recentes, registros, ultimo_id)
+    if escritor is not None:
+        escritor.fechar()
+
+    # Troca a cópia antiga pela nova e descarta os deltas, que já estão dentro dela
+    definitiva = os.path.join(pasta_tabela, "snapshot")
+    shutil.rmtree(definitiva, ignore_errors=True)
+    os.replace(temporaria, definitiva)
+    shutil.rmtree(os.path.join(pasta_tabela, "delta"), ignore_errors=True)
+    gravar_cursor(pasta_tabela, {
+        "ultimo_id": ultimo_id, "ultima_data": ultima_data, "formato": formato,
+        "ids_recentes": sorted(recentes), "atualizado_em": datetime.now(fuso_br).isoformat(),
+    })
+    return total
+
+
+def exportar_delta(cliente, tabela, pasta_tabela, formato=None, separador=";"):
+    """Grava em um novo arquivo de delta os registros ainda não exportados; devolve quantos foram exportados.
+
+    Sem formato, usa o do cursor; um formato diferente do cursor é recusado para não misturar
+    CSV e Parquet na pasta lida pelo Power BI.
+    """
+    cursor = ler_cursor(pasta_tabela)
+    formato_cursor = cursor.get("formato")
+    formato = formato or formato_cursor or "csv"
+    if formato_cursor and formato != formato_cursor:
+        raise ValueError(
+            f"{tabela}: a pasta já tem arquivos em {formato_cursor}; rode com --completo para trocar para {formato}"
+        )
+    pasta_delta = os.path.join(pasta_tabela, "delta")
+    os.makedirs(pasta_delta, exist_ok=True)
+    temporario = os.path.join(pasta_delta, f"delta.{formato}.tmp")
+
+    coluna_data = TABELAS_EXPORTACAO[tabela]
+    recentes = set(cursor.get("ids_recentes", []))
+    primeiro_id, ultimo_id, ultima_data, total, escritor = None, cursor["ultimo_id"], cursor.get("ultima_data"), 0, None
+    for registros in ler_lotes(cliente, tabela, max(0, cursor["ultimo_id"] - JANELA_EXPORTACAO)):
+        novos = [r for r in registros if r["id"] not in recentes]
+        if novos:
+            if escritor is None:
+                escritor = novo_escritor(temporario, formato, separador)
+                primeiro_id = novos[0]["id"]
+            escritor.escrever(novos)
+            total += len(novos)
+        if registros[-1]["id"] > ultimo_id:
+            ultimo_id, ultima_data = registros[-1]["id"], registros[-1].get(coluna_data)
+        recentes = lembrar_ids(recentes, novos, ultimo_id)
+    if escritor is None:
+        return 0
+    escritor.fechar()
+
+    os.replace(temporario, os.path.join(pasta_delta, f"delta-{primeiro_id:012d}-{ultimo_id:012d}.{formato}"))
+    gravar_cursor(pasta_tabela, {
+        **cursor, "ultimo_id": ultimo_id, "ultima_data": ultima_data, "formato": formato,
+        "ids_recentes": sorted(recentes), "atualizado_em": datetime.now(fuso_br).isoformat(),
+    })
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--saida", required=True, help="pasta lida pelo Power BI")
+    parser.add_argument("--tabelas", default=",".join(TABELAS_EXPORTACAO), help="tabelas a exportar, separadas por vírgula")
+    parser.add_argument("--formato", choices=("csv", "parquet"), help="padrão: o da última exportação da tabela (ou csv)")
+    parser.add_argument("--separador", default=";", help="separador do CSV")
+    parser.add_argument("--completo", action="store_true", help="regrava a cópia completa e reinicia os deltas")
+    args = parser.parse_args()
+
+    cliente = conectar_supabase()
+    for tabela in args.tabelas.split(","):
+        pasta_tabela = os.path.join(args.saida, tabela)
+        os.makedirs(pasta_tabela, exist_ok=True)
+        if args.completo:
+            formato = args.formato or ler_cursor(pasta_tabela).get("formato", "csv")
+            total = exportar_completo(cliente, tabela, pasta_tabela, formato, args.separador)
+            print(f"{tabela}: cópia completa com {total} registros")
+        else:
+            try:
+                total = exportar_delta(cliente, tabela, pasta_tabela, args.formato, args.separador)
+            except ValueError as e:
+                parser.error(str(e))
+            print(f"{tabela}: {total} registros novos")
+
+
+if __name__ == "__main__":
+    main()